@@ -0,0 +1,269 @@
+import pandas as pd
+import numpy as np
+
+from shared_data import load_shared_arrays
+
+# Taille des blocs des sommes préfixes (voir _BlockPrefix)
+PREFIX_BLOCK_ROWS = 64
+
+
+class PrefixAggregates:
+    """
+    Sommes préfixes par ticker (en ignorant les NaN) pour des agrégats en
+    temps constant sur n'importe quelle plage de dates.
+
+    Pour chaque métrique, on garde la somme cumulée des valeurs finies, le
+    nombre cumulé de valeurs renseignées et, s'il y en a, le nombre cumulé de
+    ±inf. La somme, le nombre et la moyenne de [start, end] pour un ticker
+    sont alors quelques lectures et soustractions (plus deux recherches
+    binaires pour trouver les lignes), quelle que soit la longueur de la plage.
+    Les moyennes suivent pandas : une valeur +inf (ou -inf) rend la moyenne
+    infinie, les deux ensemble la rendent NaN.
+    """
+
+    def __init__(self, index, tickers, layers):
+        """
+        index : DatetimeIndex trié des lignes des couches
+        tickers : tickers (colonnes des couches)
+        layers : dict métrique -> tableau (dates x tickers), ex: 'return',
+                 ('volatility', 7) pour la volatilité sur 7 jours
+        """
+        self.index = index
+        self.tickers = list(tickers)
+        self._ticker_pos = {ticker: i for i, ticker in enumerate(self.tickers)}
+        self._sums = {}
+        self._counts = {}
+        self._infs = {}
+
+        for metric, layer in layers.items():
+            values = np.asarray(layer, dtype=np.float64)
+            finite = np.isfinite(values)
+            self._sums[metric] = _BlockPrefix(np.where(finite, values, 0.0))
+            # Nombres cumulés en int32 (au plus le nombre de lignes) : moitié moins de mémoire
+            self._counts[metric] = _prefix(~np.isnan(values), dtype=np.int32)
+            if np.isinf(values).any():
+                self._infs[metric] = (_prefix(values == np.inf, dtype=np.int32),
+                                      _prefix(values == -np.inf, dtype=np.int32))
+
+    @classmethod
+    def from_arrays(cls, index, tickers, arrays):
+        """Agrégats reconstruits à partir de tableaux publiés (voir arrays), sans recalcul."""
+        aggregates = cls(index, tickers, {})
+        block = int(arrays['block'][0])
+        for name in arrays:
+            metric, part = name.rsplit('.', 1) if '.' in name else (None, name)
+            if part == 'counts':
+                aggregates._sums[metric] = _BlockPrefix.from_arrays(
+                    arrays[f'{metric}.local'], arrays[f'{metric}.totals'], arrays[f'{metric}.block_prefix'], block)
+                aggregates._counts[metric] = arrays[name]
+                if f'{metric}.pos_inf' in arrays:
+                    aggregates._infs[metric] = (arrays[f'{metric}.pos_inf'], arrays[f'{metric}.neg_inf'])
+        return aggregates
+
+    @property
+    def arrays(self):
+        """Tableaux des agrégats (dict nom -> tableau), à publier avec shared_data.publish_arrays."""
+        arrays = {'block': np.array([PREFIX_BLOCK_ROWS])}
+        for metric, prefix in self._sums.items():
+            arrays[f'{metric}.local'] = prefix.local
+            arrays[f'{metric}.totals'] = prefix.totals
+            arrays[f'{metric}.block_prefix'] = prefix.block_prefix
+            arrays[f'{metric}.counts'] = self._counts[metric]
+            if metric in self._infs:
+                arrays[f'{metric}.pos_inf'], arrays[f'{metric}.neg_inf'] = self._infs[metric]
+        return arrays
+
+    @property
+    def metrics(self):
+        return self._sums.keys()
+
+    @property
+    def nbytes(self):
+        arrays = [*self._counts.values(), *(a for pair in self._infs.values() for a in pair)]
+        return sum(a.nbytes for a in arrays) + sum(prefix.nbytes for prefix in self._sums.values())
+
+    def covers(self, df, metric, tickers=None):
+        """Vrai si les agrégats répondent pour ce DataFrame (même index), cette métrique et ces tickers."""
+        return (metric in self._sums
+                and len(df.index) == len(self.index) and df.index.equals(self.index)
+                and (tickers is None or list(tickers) == self.tickers))
+
+    def rows(self, start, end, include_start=True):
+        """Tranche des lignes de [start, end] (]start, end] si include_start=False)."""
+        lo = self.index.searchsorted(pd.Timestamp(start), side='left' if include_start else 'right')
+        hi = self.index.searchsorted(pd.Timestamp(end), side='right')
+        return slice(int(lo), int(max(hi, lo)))
+
+    def known_tickers(self, tickers):
+        """Tickers connus des agrégats, dans l'ordre donné."""
+        return [ticker for ticker in tickers if ticker in self._ticker_pos]
+
+    def columns(self, tickers=None):
+        """Positions des tickers connus (tous si tickers vaut None)."""
+        if tickers is None:
+            return list(range(len(self.tickers)))
+        return [self._ticker_pos[ticker] for ticker in tickers if ticker in self._ticker_pos]
+
+    def sum(self, metric, rows, tickers=None):
+        """Somme des valeurs finies de chaque ticker sur les lignes rows."""
+        return self._sums[metric].span(rows, self.columns(tickers))
+
+    def count(self, metric, rows, tickers=None):
+        """Nombre de valeurs renseignées (non NaN) de chaque ticker sur les lignes rows."""
+        cols = self.columns(tickers)
+        prefix = self._counts[metric]
+        return prefix[rows.stop, cols] - prefix[rows.start, cols]
+
+    def mean(self, metric, rows, tickers=None):
+        """Moyenne de chaque ticker sur les lignes rows (NaN si aucune valeur)."""
+        return self._mean(metric, rows, self.columns(tickers), pooled=False)
+
+    def pooled_mean(self, metric, rows, tickers=None):
+        """Moyenne de toutes les valeurs des tickers sur les lignes rows (NaN si aucune valeur)."""
+        return self._mean(metric, rows, self.columns(tickers), pooled=True)
+
+    def stats(self, metric, rows, tickers=None):
+        """
+        Statistiques de chaque ticker sur les lignes rows (tickers x 4) :
+        somme des valeurs finies, nombre de valeurs, nombre de +inf et de -inf
+        (même format que group_matrix.ticker_stats).
+        """
+        cols = self.columns(tickers)
+        stats = np.zeros((len(cols), 4))
+        stats[:, 0] = self._sums[metric].span(rows, cols)
+        stats[:, 1] = self.count(metric, rows, tickers)
+        if metric in self._infs:
+            for k, prefix in enumerate(self._infs[metric], start=2):
+                stats[:, k] = prefix[rows.stop, cols] - prefix[rows.start, cols]
+        return stats
+
+    def window_means(self, metric, starts, stops):
+        """
+        Moyennes et nombres de valeurs (fenêtres x tickers) de plusieurs
+        plages de lignes [starts[i], stops[i][ à la fois.
+        """
+        starts, stops = np.asarray(starts, dtype=np.intp), np.asarray(stops, dtype=np.intp)
+
+        def span(prefix):
+            return prefix[stops] - prefix[starts]
+
+        count = span(self._counts[metric])
+        infs = tuple(span(prefix) for prefix in self._infs[metric]) if metric in self._infs else None
+        return _mean_from_sums(self._sums[metric].spans(starts, stops), count, infs), count
+
+    def _mean(self, metric, rows, cols, pooled):
+        def span(prefix):
+            values = prefix[rows.stop, cols] - prefix[rows.start, cols]
+            return values.sum() if pooled else values
+
+        total = self._sums[metric].span(rows, cols)
+        if pooled:
+            total = total.sum()
+        infs = tuple(span(prefix) for prefix in self._infs[metric]) if metric in self._infs else None
+        mean = _mean_from_sums(total, span(self._counts[metric]), infs)
+        return mean[()] if pooled else mean
+
+
+class _BlockPrefix:
+    """
+    Sommes préfixes par blocs de PREFIX_BLOCK_ROWS lignes : cumul à
+    l'intérieur de chaque bloc, plus le cumul des totaux de blocs.
+
+    Une plage courte (dans un bloc ou deux blocs voisins) ne soustrait que
+    des cumuls locaux : pas de perte de précision due aux grandes valeurs
+    (aberrantes) situées plus tôt dans l'historique, comme avec un cumul global.
+    """
+
+    @classmethod
+    def from_arrays(cls, local, totals, block_prefix, block=PREFIX_BLOCK_ROWS):
+        prefix = cls.__new__(cls)
+        prefix.local, prefix.totals, prefix.block_prefix, prefix.block = local, totals, block_prefix, block
+        return prefix
+
+    def __init__(self, values, block=PREFIX_BLOCK_ROWS):
+        n_rows, n_cols = values.shape
+        self.block = block
+        n_blocks = n_rows // block + 1
+
+        padded = np.zeros((n_blocks * block, n_cols))
+        padded[:n_rows] = values
+        blocks = padded.reshape(n_blocks, block, n_cols)
+
+        # local[i] = somme des lignes [début du bloc de i, i[
+        local = np.zeros_like(blocks)
+        np.cumsum(blocks[:, :-1], axis=1, out=local[:, 1:])
+        self.local = local.reshape(-1, n_cols)[:n_rows + 1]
+        self.totals = blocks.sum(axis=1)
+        self.block_prefix = _prefix(self.totals)
+
+    @property
+    def nbytes(self):
+        return self.local.nbytes + self.totals.nbytes + self.block_prefix.nbytes
+
+    def span(self, rows, cols):
+        """Somme des lignes rows (tranche) pour les colonnes cols."""
+        lo, hi = rows.start, rows.stop
+        block_lo, block_hi = lo // self.block, hi // self.block
+        if block_lo == block_hi:
+            return self.local[hi, cols] - self.local[lo, cols]
+        # Fin du premier bloc + blocs complets intermédiaires + début du dernier bloc
+        middle = self.block_prefix[block_hi, cols] - self.block_prefix[block_lo + 1, cols]
+        return (self.totals[block_lo, cols] - self.local[lo, cols]) + middle + self.local[hi, cols]
+
+    def spans(self, lo, hi):
+        """Sommes des lignes [lo[i], hi[i][ (tableaux de positions) pour toutes les colonnes."""
+        block_lo, block_hi = lo // self.block, hi // self.block
+        inside = self.local[hi] - self.local[lo]
+        middle = self.block_prefix[block_hi] - self.block_prefix[block_lo + 1]
+        across = (self.totals[block_lo] - self.local[lo]) + middle + self.local[hi]
+        return np.where((block_lo == block_hi)[:, None], inside, across)
+
+
+def _mean_from_sums(total, count, infs=None):
+    """Moyenne à partir des sommes et des nombres de valeurs ; infs = (nombre de +inf, nombre de -inf)."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.divide(total, count)
+    mean = np.where(count > 0, mean, np.nan)
+
+    if infs is not None:
+        pos_inf, neg_inf = infs
+        mean = np.where(pos_inf > 0, np.where(neg_inf > 0, np.nan, np.inf), np.where(neg_inf > 0, -np.inf, mean))
+    return mean
+
+def _prefix(values, dtype=np.float64):
+    """Cumul par colonne précédé d'une ligne de zéros (prefix[i] = somme des i premières lignes)."""
+    prefix = np.zeros((values.shape[0] + 1, values.shape[1]), dtype=dtype)
+    np.cumsum(values, axis=0, out=prefix[1:])
+    return prefix
+
+
+def build_prefix_aggregates(derived, shared_path=None, data_version=None):
+    """
+    Agrégats préfixes à partir d'un registre DerivedMetrics : volumes,
+    rendements et variations depuis la dernière cotation, les seules
+    métriques lues par la choroplèthe et la comparaison. La volatilité de la
+    comparaison est lue dans le VolatilityCube (au plus quelques dizaines de
+    lignes par événement) : des couches préfixes pour chacune de ses
+    fenêtres coûteraient plusieurs fois la taille du panel dans chaque worker.
+
+    Mémoire (voir nbytes) : par métrique, une somme préfixe float64 et des
+    nombres cumulés int32 de la taille du panel, soit environ six fois le
+    panel de volumes (float64) au total.
+
+    shared_path : préfixe de publication (voir shared_data.load_shared_arrays) ;
+    les agrégats sont alors calculés une fois et partagés entre les workers.
+    """
+    tickers = derived.tickers
+
+    def build():
+        layers = {
+            'volume': derived.volume_values(tickers),
+            'return': derived.values(tickers, 'return'),
+            'change': derived.values(tickers, 'change'),
+        }
+        return PrefixAggregates(derived.index, tickers, layers)
+
+    if shared_path is None:
+        return build()
+    arrays = load_shared_arrays(shared_path, lambda: build().arrays, data_version)
+    return PrefixAggregates.from_arrays(derived.index, tickers, arrays)
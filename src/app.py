@@ -1,17 +1,54 @@
 import json
+import os
 import pandas as pd
+import numpy as np
 import dash
+import flask
 from dash import html
 
-from data_loader import load_market_data
-from data_processor import compute_daily_returns, compute_volatility
+from data_loader import load_market_data, get_data_version
+from data_processor import DerivedMetrics
 from layout_components import create_header, create_volume_section, create_heatmap_section, create_volatility_section, create_choropleth_section, create_compare_section
 from callbacks import register_callbacks
+from shared_data import load_shared_dataset
+from lazy_dataset import LazyMarketDataset
+from sql_store import open_sql_store
+from pyramid import ResolutionPyramid
+from rolling_stats import VolatilityCube
+from event_tensor import build_event_tensors
+from aggregates import build_prefix_aggregates
+from figure_cache import FigureCache
 
 # === 1) CHARGEMENT DES DONNÉES ===
-df = load_market_data()
-df = compute_daily_returns(df)
-df = compute_volatility(df)
+def build_dataset():
+    # MARKET_LOAD_WORKERS > 1 : lecture parallèle des CSV lors d'une reconstruction du cache
+    # MARKET_LOAD_CHUNKSIZE : lecture en flux par blocs de N lignes (mémoire bornée)
+    chunksize = int(os.environ.get("MARKET_LOAD_CHUNKSIZE", "0")) or None
+    # Seuls les volumes sont chargés : rendements et volatilités sont calculés à la demande (DerivedMetrics)
+    return load_market_data(n_workers=int(os.environ.get("MARKET_LOAD_WORKERS", "1")), chunksize=chunksize)
+
+# MARKET_SHARED_DATA=/dev/shm/market_data : un seul processus construit les données,
+# les workers gunicorn s'attachent au même fichier mappé en mémoire (lecture seule).
+# Les structures dérivées (cube de volatilité, tenseur des événements, sommes
+# préfixes) sont publiées à côté, avec le même préfixe. Restent propres à chaque
+# worker : le cache des métriques dérivées (borné par MARKET_METRICS_MAX_MB),
+# la pyramide hebdomadaire/mensuelle (quelques Ko) et le cache des figures
+# (borné par MARKET_FIGURE_CACHE_MB).
+# MARKET_LAZY=1 : chargement à la demande des partitions annuelles (cache LRU borné)
+# MARKET_SQL_STORE=data/market.sqlite : fenêtres lues dans une base locale (SQLite/DuckDB)
+# MARKET_METRICS_MAX_MB : mémoire maximale du cache des métriques dérivées (défaut 256)
+shared_data_path = os.environ.get("MARKET_SHARED_DATA")
+sql_store_path = os.environ.get("MARKET_SQL_STORE")
+if sql_store_path:
+    df = open_sql_store(sql_store_path)
+elif os.environ.get("MARKET_LAZY"):
+    df = LazyMarketDataset(max_bytes=int(os.environ.get("MARKET_LAZY_MAX_MB", "512")) * 1024 ** 2)
+else:
+    if shared_data_path:
+        volumes = load_shared_dataset(shared_data_path, build_dataset, data_version=get_data_version())
+    else:
+        volumes = build_dataset()
+    df = DerivedMetrics(volumes, max_bytes=int(os.environ.get("MARKET_METRICS_MAX_MB", "256")) * 1024 ** 2)
 
 # === 2) CONFIGURATIONS ===
 with open("config/events.json", "r") as f:
@@ -26,8 +63,43 @@ for ev in events:
 # Variables globales
 regions_map = cfg["regions"]
 
+# Fenêtres de volatilité atteignables depuis les sliders (volatilité : 3-14, comparaison : jusqu'à 2x14+1)
+VOLATILITY_WINDOWS = range(3, 30)
+
 # Obtenir la liste des tickers disponibles
-available_tickers = [col for col in df.columns if not col.endswith(('_return', '_volatility'))]
+# (et la pyramide journalier/hebdomadaire/mensuel des volumes pour la vue polaire)
+if hasattr(df, 'frame_for'):
+    available_tickers = df.tickers
+    pyramid = None
+    vol_cube = None
+    event_tensors = None
+    aggregates = None
+else:
+    available_tickers = df.tickers
+    pyramid = ResolutionPyramid(df.volumes)
+
+    # Cube des volatilités (fenêtre x date x ticker) pour toutes les fenêtres des sliders
+    # MARKET_VOL_CUBE_DTYPE=float32 : moitié moins de mémoire
+    # MARKET_VOL_CUBE_PATH=.cache/vol_cube.npy : cube gardé sur disque (mappé en mémoire), partagé entre
+    # les workers et réutilisé tant que la version des données ne change pas
+    # (par défaut à côté des données partagées si MARKET_SHARED_DATA est défini)
+    cube_dtype = np.dtype(os.environ.get("MARKET_VOL_CUBE_DTYPE", "float64"))
+    cube_bytes = VolatilityCube.estimate_nbytes(len(VOLATILITY_WINDOWS), len(df.index), len(available_tickers), cube_dtype)
+    print(f"🧊 Cube de volatilité: {len(VOLATILITY_WINDOWS)} fenêtres x {len(df.index)} dates x "
+          f"{len(available_tickers)} tickers ({cube_dtype.name}) = {cube_bytes / 1024 ** 2:.1f} Mo")
+    returns = pd.DataFrame(df.values(available_tickers, 'return'), index=df.index, columns=available_tickers)
+    cube_path = os.environ.get("MARKET_VOL_CUBE_PATH") or (f"{shared_data_path}.vol_cube.npy" if shared_data_path else None)
+    vol_cube = VolatilityCube(returns, VOLATILITY_WINDOWS, cube_dtype, cube_path, key=get_data_version())
+
+    # Tenseur (événement x ticker x décalage x métrique) pour k = -30..+30, en jours calendaires (heatmap, volatilité)
+    event_tensors = build_event_tensors(df, events, vol_cube, shared_path=shared_data_path and f"{shared_data_path}.events",
+                                        data_version=get_data_version())
+    print(f"🎯 Tenseurs des événements: {sum(t.nbytes for t in event_tensors.values()) / 1024 ** 2:.1f} Mo")
+
+    # Sommes préfixes par ticker (volumes, rendements, variations) : moyennes en temps constant sur toute plage de dates
+    aggregates = build_prefix_aggregates(df, shared_path=shared_data_path and f"{shared_data_path}.aggregates",
+                                         data_version=get_data_version())
+    print(f"➕ Sommes préfixes: {aggregates.nbytes / 1024 ** 2:.1f} Mo")
 tickers_list = sorted(available_tickers)
 
 # Obtenir la liste des événements et des catégories
@@ -48,6 +120,17 @@ regions_map = {
 app = dash.Dash(__name__)
 server = app.server
 
+# MARKET_FIGURE_CACHE_MB : mémoire maximale du cache des figures (défaut 64, 0 = désactivé)
+# Les figures sont indexées par les entrées des callbacks et la version des CSV sources
+# Les figures gardées correspondent aux données chargées au démarrage : redémarrer après refresh_data.py
+figure_cache_mb = int(os.environ.get("MARKET_FIGURE_CACHE_MB", "64"))
+figure_cache = FigureCache(figure_cache_mb * 1024 ** 2, version=get_data_version()) if figure_cache_mb > 0 else None
+
+@server.route("/figure-cache")
+def figure_cache_stats():
+    """Compteurs du cache des figures (hits, misses, mémoire)."""
+    return flask.jsonify(figure_cache.stats() if figure_cache is not None else {'enabled': False})
+
 # === 4) LAYOUT PRINCIPAL ===
 app.layout = html.Div(
     style={'maxWidth':'900px','margin':'auto','padding':'20px'},
@@ -63,7 +146,10 @@ app.layout = html.Div(
 )
 
 # === 5) ENREGISTREMENT DES CALLBACKS ===
-register_callbacks(app, df, events, regions_map)
+# MARKET_RENDER_MODE=auto|svg|webgl : rendu des vues denses (auto = WebGL au-delà de 1000 points)
+register_callbacks(app, df, events, regions_map, pyramid, vol_cube, event_tensors, aggregates,
+                   render_mode=os.environ.get("MARKET_RENDER_MODE", "auto"), figure_cache=figure_cache,
+                   data_version=get_data_version())
 
 # === 6) LANCEMENT ===
 if __name__ == '__main__':
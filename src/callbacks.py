@@ -1,15 +1,60 @@
 from dash.dependencies import Input, Output
-from viz_volume import build_polar_volume_chart
+from viz_volume import build_polar_volume_chart, POLAR_MIN_POINTS
 from viz_heatmap import build_heatmap
 from viz_volatility import build_volatility_chart
 from viz_choropleth import build_choropleth
 from viz_compare import build_compare_chart
+from data_processor import DerivedMetrics
 
 
-def register_callbacks(app, df, events, regions_map):
+def register_callbacks(app, df, events, regions_map, pyramid=None, vol_cube=None, event_tensors=None, aggregates=None, render_mode="auto", figure_cache=None, data_version=None):
     """
     Enregistre tous les callbacks de l'application.
+    pyramid : ResolutionPyramid des volumes (optionnelle) ; la vue polaire
+    utilise alors le niveau le plus grossier qui garde assez de points.
+    vol_cube : VolatilityCube (optionnel) des fenêtres des sliders de volatilité.
+    event_tensors : EventTensor par unité de jours (optionnels) ; la heatmap et
+    la volatilité lisent alors des tranches du tenseur en jours calendaires
+    au lieu de l'historique.
+    aggregates : PrefixAggregates (optionnels) pour les moyennes en temps constant
+    sur n'importe quelle plage de dates (choroplèthe, comparaison).
+    render_mode : rendu des vues denses (polaire, volatilité) : "auto" (WebGL
+    au-delà de WEBGL_MIN_POINTS points), "svg" ou "webgl".
+    figure_cache : FigureCache (optionnel) ; une figure déjà construite pour
+    les mêmes entrées et la même version des données est resservie telle quelle.
+    data_version : version des données chargées (get_data_version()), clé du
+    cache des profils de la vue polaire.
+    df peut être un DataFrame complet, un registre de métriques dérivées
+    (DerivedMetrics, seules les métriques utiles à chaque vue sont calculées)
+    ou une source à la demande exposant frame_for(dates, pad_days) et
+    history(ticker) (LazyMarketDataset, SqlMarketStore).
     """
+    on_demand = hasattr(df, 'frame_for')
+    derived = isinstance(df, DerivedMetrics)
+    event_dates = {e['name']: e['date'] for e in events}
+    event_tensors = event_tensors or {}
+    calendar_tensor = event_tensors.get('calendar')
+
+    def _frame_around(event_names, window_days, metrics=('return',)):
+        """Données nécessaires autour des événements (seules les fenêtres utiles à la demande)."""
+        if derived:
+            return df.frame(metrics)
+        if not on_demand:
+            return df
+        dates = [event_dates[name] for name in event_names if name in event_dates]
+        return df.frame_for(dates, pad_days=window_days)
+
+    def _cached(view, build, *inputs):
+        """Figure de la vue pour ces entrées, via le cache des figures s'il est actif."""
+        if figure_cache is None:
+            return build()
+        return figure_cache.get_or_build(view, build, *inputs)
+
+    def _ticker_history(ticker):
+        """Historique complet des volumes (vue polaire)."""
+        if derived:
+            return df.volumes
+        return df.history(ticker) if on_demand else df
     
     # ======================= CALLBACK VISU 1: VOLUME POLAIRE =======================
     @app.callback(
@@ -19,7 +64,14 @@ def register_callbacks(app, df, events, regions_map):
         Input('window-slider', 'value')
     ) 
     def update_volume_chart(ticker, rolling_window): 
-        fig = build_polar_volume_chart(df, events, ticker, rolling_window)
+        def build():
+            if pyramid is not None:
+                tier = pyramid.select(min_points=POLAR_MIN_POINTS)
+                return build_polar_volume_chart(pyramid.frame(tier), events, ticker, rolling_window, pyramid.days(tier),
+                                                render_mode=render_mode, data_key=(data_version, tier))
+            return build_polar_volume_chart(_ticker_history(ticker), events, ticker, rolling_window,
+                                            render_mode=render_mode, data_key=(data_version, 'history'))
+        fig = _cached('volume', build, ticker, rolling_window)
         return fig, f"{int(rolling_window)} jours"
 
 # ======================= CALLBACK VISU 2: HEATMAP DES RENDEMENTS =======================
@@ -31,8 +83,9 @@ def register_callbacks(app, df, events, regions_map):
     def update_heatmap(selected_event, window_days):
         """Met à jour la heatmap selon l'événement et la fenêtre temporelle."""
         if not selected_event:
-            return build_heatmap(df, events, events[0]['name'], window_days)
-        return build_heatmap(df, events, selected_event, window_days)
+            selected_event = events[0]['name']
+        return _cached('heatmap', lambda: build_heatmap(_frame_around([selected_event], window_days), events, selected_event, window_days, tensor=calendar_tensor),
+                       selected_event, window_days)
 
 # ======================= CALLBACK VISU 3: VOLATILITÉ =======================
     @app.callback(
@@ -46,8 +99,9 @@ def register_callbacks(app, df, events, regions_map):
         rolling_window = max(3, window_days)
         
         if not selected_event:
-            return build_volatility_chart(df, events, events[0]['name'], window_days, rolling_window, grouping)
-        return build_volatility_chart(df, events, selected_event, window_days, rolling_window, grouping)
+            selected_event = events[0]['name']
+        return _cached('volatility', lambda: build_volatility_chart(_frame_around([selected_event], window_days), events, selected_event, window_days, rolling_window, grouping, cube=vol_cube, tensor=calendar_tensor, render_mode=render_mode),
+                       selected_event, window_days, grouping)
     
 # ======================= CALLBACK VISU 4: CHOROPLETH =======================
     @app.callback(
@@ -56,7 +110,8 @@ def register_callbacks(app, df, events, regions_map):
         Input('choro-window-slider','value')
     )
     def update_choropleth(event_name, post_window):
-        return build_choropleth(df, events, event_name, regions_map, post_window=post_window)
+        return _cached('choropleth', lambda: build_choropleth(_frame_around([event_name], max(post_window, 5), metrics=()), events, event_name, regions_map, post_window=post_window, aggregates=aggregates),
+                       event_name, post_window)
 
 
 # ======================= CALLBACK VISU 5: COMPARAISON DES CRISES =======================
@@ -64,14 +119,17 @@ def register_callbacks(app, df, events, regions_map):
         Output('compare-chart', 'figure'),
         Input('compare-category-dropdown', 'value'),
         Input('compare-mode-radio', 'value'),
-        Input('compare-window-slider', 'value')
+        Input('compare-window-slider', 'value'),
+        Input('compare-days-radio', 'value')
     )
-    def update_compare(selected_category, mode, window_days):
+    def update_compare(selected_category, mode, window_days, day_unit='calendar'):
         """Met à jour la comparaison selon la catégorie, métrique et fenêtre."""
         if not selected_category:
             # Récupérer la première catégorie disponible
             categories = list(set([e.get("category", "Autre") for e in events if e.get("category")]))
             selected_category = categories[0] if categories else "Géopolitique"
         
-        return build_compare_chart(df, events, selected_category, window_days, mode)
+        category_events = [e['name'] for e in events if e.get("category") == selected_category]
+        return _cached('compare', lambda: build_compare_chart(_frame_around(category_events, window_days), events, selected_category, window_days, mode, cube=vol_cube, day_unit=day_unit, aggregates=aggregates),
+                       selected_category, mode, window_days, day_unit)
 
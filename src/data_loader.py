@@ -1,62 +1,459 @@
 import pandas as pd
+import numpy as np
 from pathlib import Path
 import glob
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 
-def load_market_data(data_dir="data", pattern="*_Glob*l_Markets_Data.csv"):
+try:
+    import resource
+except ImportError:  # Windows : pas de mesure du pic RSS
+    resource = None
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou inter-processus
+    fcntl = None
+
+from market_panel import MarketPanel, PANEL_FIELDS, PANEL_GROWTH_ROWS
+
+CACHE_VERSION = 5
+
+# Colonnes obligatoires dans les CSV et types explicites de toutes les colonnes lues
+REQUIRED_COLUMNS = ['Ticker', 'Date', 'Volume']
+MARKET_DTYPES = {'Ticker': str, 'Date': str, **{field: 'float64' for field in PANEL_FIELDS}}
+
+
+def load_market_data(data_dir="data", pattern="*_Glob*l_Markets_Data.csv", use_cache=True, cache_dir=None, n_workers=1, chunksize=None):
     """
     Charge et combine tous les fichiers CSV de données de marché.
     Retourne un DataFrame avec les dates en index et les tickers en colonnes.
-    
+
     Pattern modifié pour capturer les fichiers avec "Global" et "Globla" (faute de frappe)
+
+    Le DataFrame retourné est le champ Volume du panel OHLCV (voir
+    load_market_panel), sous forme de vue sans copie.
+    """
+    panel = load_market_panel(data_dir, pattern, use_cache, cache_dir, n_workers, chunksize)
+    return panel.field('Volume')
+
+
+def load_market_panel(data_dir="data", pattern="*_Glob*l_Markets_Data.csv", use_cache=True, cache_dir=None, n_workers=1, chunksize=None):
+    """
+    Charge tous les fichiers CSV dans un MarketPanel (dates x tickers x champs OHLCV, float64).
+
+    Le panel final est mis en cache sur disque (.npy) dans cache_dir
+    (par défaut data_dir/.cache). La clé du cache dépend des noms, tailles et
+    dates de modification des CSV : un démarrage à chaud se contente de
+    mapper le cache en mémoire, seul un CSV modifié déclenche une reconstruction.
+
+    n_workers > 1 lit les fichiers en parallèle sur un pool de processus
+    (filtrage des colonnes et des types dans chaque worker) et affiche le
+    temps de lecture de chaque fichier. Le panel obtenu est identique à
+    celui de la lecture séquentielle.
+
+    chunksize (nombre de lignes) active la lecture en flux à mémoire bornée :
+    chaque fichier est lu par blocs, versés directement dans le panel
+    préalloué, et le pic de mémoire (RSS) est affiché. Prioritaire sur n_workers.
     """
     data_path = Path(data_dir)
-    
+
     # Trouver tous les fichiers CSV correspondant au pattern élargi
     csv_files = glob.glob(str(data_path / pattern))
-    
+
+    if not csv_files:
+        raise FileNotFoundError(f"Aucun fichier trouvé avec le pattern {pattern} dans {data_dir}")
+
+    cache_path = Path(cache_dir) if cache_dir else data_path / ".cache"
+    file_stats = _scan_files(csv_files)
+    cache_key = _compute_cache_key(file_stats)
+
+    if use_cache:
+        cached_panel = _read_panel_cache(cache_path, cache_key)
+        if cached_panel is not None:
+            return cached_panel
+
+    if chunksize:
+        panel = _stream_panel_from_csv(csv_files, chunksize)
+    else:
+        panel = _build_panel_from_csv(csv_files, n_workers)
+
+    if use_cache:
+        _write_panel_cache(cache_path, cache_key, file_stats, panel)
+
+    return panel
+
+
+def refresh_market_panel(panel=None, data_dir="data", pattern="*_Glob*l_Markets_Data.csv", cache_dir=None):
+    """
+    Mise à jour incrémentale du panel en cache avec les nouvelles lignes journalières.
+
+    Seuls les CSV modifiés depuis l'écriture du cache sont relus, et seules
+    leurs lignes postérieures à la dernière date du panel sont ajoutées.
+    Une modification de l'historique (lignes antérieures) n'est pas détectée :
+    utiliser load_market_panel(use_cache=False) pour une reconstruction complète.
+    Un nouveau ticker déclenche aussi une reconstruction complète.
+
+    Le cache disque garde des dates en réserve : les nouvelles lignes y sont
+    écrites en fin de tableau, sans réécrire l'historique, et le panel
+    retourné est le cache prolongé mappé en mémoire. Le coût d'une mise à
+    jour dépend donc des nouvelles lignes, pas de la longueur de l'historique.
+    Point d'entrée quotidien : refresh_data.py.
+
+    Parameters:
+    -----------
+    panel : MarketPanel courant (par défaut relu depuis le cache)
+
+    Returns:
+    --------
+    (panel mis à jour, DatetimeIndex des dates ajoutées)
+    """
+    data_path = Path(data_dir)
+    csv_files = glob.glob(str(data_path / pattern))
+
     if not csv_files:
         raise FileNotFoundError(f"Aucun fichier trouvé avec le pattern {pattern} dans {data_dir}")
 
-    
+    cache_path = Path(cache_dir) if cache_dir else data_path / ".cache"
+    file_stats = _scan_files(csv_files)
+    cache_key = _compute_cache_key(file_stats)
+    manifest = _read_manifest(cache_path)
+
+    if panel is None:
+        panel = _read_panel_cache(cache_path)
+    if panel is None or manifest is None:
+        # Aucun état précédent : chargement complet
+        panel = load_market_panel(data_dir, pattern, cache_dir=cache_dir)
+        return panel, panel.dates
+
+    if manifest.get("key") == cache_key:
+        return panel, panel.dates[:0]
+
+    # Ne relire que les fichiers dont la taille ou la date de modification a changé
+    known_stats = manifest.get("files", {})
+    changed_files = [file for file in csv_files if known_stats.get(Path(file).name) != file_stats[Path(file).name]]
+
+    last_date = panel.dates[-1]
+    new_rows = []
+    for file in changed_files:
+        df, _ = _read_market_file(file)
+        if df is not None:
+            new_rows.append(df[df['Date'] > last_date])
+
+    new_rows = pd.concat(new_rows, ignore_index=True) if new_rows else pd.DataFrame(columns=['Date', 'Ticker'])
+
+    try:
+        new_dates, block = panel.new_rows(new_rows)
+    except KeyError as e:
+        print(f"⚠️ {e} : reconstruction complète du panel")
+        panel = load_market_panel(data_dir, pattern, cache_dir=cache_dir)
+        return panel, panel.dates[panel.dates > last_date]
+
+    # Ajout en fin de cache (seules les nouvelles lignes sont écrites), puis relecture mappée
+    if _append_panel_cache(cache_path, cache_key, file_stats, len(panel.dates), new_dates, block, panel.tickers, panel.fields):
+        cached_panel = _read_panel_cache(cache_path, cache_key)
+        if cached_panel is not None:
+            return cached_panel, new_dates
+
+    # Cache absent ou différent du panel : prolonger en mémoire et réécrire le cache
+    panel = panel.append(new_dates, block)
+    _write_panel_cache(cache_path, cache_key, file_stats, panel)
+    return panel, new_dates
+
+
+def get_data_version(data_dir="data", pattern="*_Glob*l_Markets_Data.csv"):
+    """
+    Version des données sources : empreinte des noms, tailles et dates de
+    modification des CSV (la même que la clé du cache disque).
+    """
+    csv_files = glob.glob(str(Path(data_dir) / pattern))
+    return _compute_cache_key(_scan_files(csv_files))
+
+
+def load_market_files(csv_files):
+    """Charge une liste de fichiers CSV dans un MarketPanel, sans passer par le cache."""
+    return _build_panel_from_csv(csv_files)
+
+
+def _build_panel_from_csv(csv_files, n_workers=1):
+    """Lit les CSV et construit le MarketPanel OHLCV."""
     # Lire et combiner tous les fichiers
-    all_dataframes = []
-    
-    for file in csv_files:
+    if n_workers > 1:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(_read_market_file, csv_files))
+        _print_read_timings(csv_files, results)
+    else:
+        results = [_read_market_file(file) for file in csv_files]
+
+    all_dataframes = [df for df, _ in results if df is not None]
 
-        df = pd.read_csv(file)
-        
-        # Vérifier que les colonnes nécessaires existent
-        required_cols = ['Ticker', 'Date', 'Volume']
-        if not all(col in df.columns for col in required_cols):
-            continue
-            
-        # Garder seulement les colonnes nécessaires
-        df = df[['Ticker', 'Date', 'Volume']].copy()
-        all_dataframes.append(df)
-    
     if not all_dataframes:
         raise ValueError("Aucun fichier valide trouvé")
-    
+
     # Combiner tous les DataFrames
     combined_df = pd.concat(all_dataframes, ignore_index=True)
-    
+
+    # Un seul tableau dates x tickers x champs (trié par date et par ticker)
+    return MarketPanel.from_long(combined_df)
+
+
+def _stream_panel_from_csv(csv_files, chunksize):
+    """
+    Construit le panel en lisant les CSV par blocs de chunksize lignes.
+
+    1re passe : dates et tickers distincts (colonnes Date, Ticker, Volume).
+    2e passe : chaque bloc est versé dans le panel préalloué. La mémoire
+    reste bornée par la taille du panel final plus un bloc.
+    """
+    valid_files = []
+    dates, tickers = set(), set()
+    for file in csv_files:
+        header = pd.read_csv(file, nrows=0).columns
+        if not all(col in header for col in REQUIRED_COLUMNS):
+            continue
+        valid_files.append((file, [col for col in MARKET_DTYPES if col in header]))
+
+        for chunk in _iter_market_chunks(file, REQUIRED_COLUMNS, chunksize):
+            dates.update(chunk['Date'].unique())
+            tickers.update(chunk['Ticker'].unique())
+
+    if not valid_files:
+        raise ValueError("Aucun fichier valide trouvé")
+
+    panel = MarketPanel.allocate(pd.DatetimeIndex(sorted(dates)), sorted(tickers))
+    volume = panel.field_values('Volume')
+
+    for file, usecols in valid_files:
+        for chunk in _iter_market_chunks(file, usecols, chunksize):
+            date_idx = panel.dates.get_indexer(chunk['Date'])
+            ticker_idx = panel.tickers.get_indexer(chunk['Ticker'])
+
+            # Doublons (Date, Ticker) : la première ligne rencontrée est conservée
+            _, first = np.unique(date_idx * len(panel.tickers) + ticker_idx, return_index=True)
+            keep = np.zeros(len(chunk), dtype=bool)
+            keep[first] = True
+            keep &= np.isnan(volume[date_idx, ticker_idx])
+            date_idx, ticker_idx = date_idx[keep], ticker_idx[keep]
+
+            for field in panel.fields:
+                if field in chunk.columns:
+                    panel.field_values(field)[date_idx, ticker_idx] = chunk[field].to_numpy(dtype=panel.values.dtype)[keep]
+
+    _print_peak_rss()
+    return panel
+
+
+def _iter_market_chunks(file, usecols, chunksize):
+    """Blocs d'un CSV avec types explicites, dates converties et volumes valides."""
+    reader = pd.read_csv(file, usecols=usecols, dtype={col: MARKET_DTYPES[col] for col in usecols}, chunksize=chunksize)
+    for chunk in reader:
+        chunk['Date'] = pd.to_datetime(chunk['Date'])
+        chunk = chunk[chunk['Volume'].notna() & (chunk['Volume'] >= 0)]
+        yield chunk
+
+
+def _print_peak_rss():
+    """Affiche le pic de mémoire résidente du processus."""
+    if resource is None:
+        return
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss est en Ko sous Linux, en octets sous macOS
+    peak_mb = peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+    print(f"📈 Pic mémoire (RSS): {peak_mb:.1f} Mo")
+
+
+def _read_market_file(file):
+    """
+    Lit un fichier CSV (utilisable dans un worker du pool de processus).
+    Retourne (DataFrame filtré ou None si colonnes manquantes, durée en secondes).
+    """
+    start = time.perf_counter()
+
+    # Vérifier que les colonnes nécessaires existent
+    header = pd.read_csv(file, nrows=0).columns
+    if not all(col in header for col in REQUIRED_COLUMNS):
+        return None, time.perf_counter() - start
+
+    # Garder seulement les colonnes utiles, avec des types explicites
+    usecols = [col for col in MARKET_DTYPES if col in header]
+    df = pd.read_csv(file, usecols=usecols, dtype={col: MARKET_DTYPES[col] for col in usecols})
+
     # Convertir la colonne Date
-    combined_df['Date'] = pd.to_datetime(combined_df['Date'])
-    
+    df['Date'] = pd.to_datetime(df['Date'])
+
     # Nettoyer les données (supprimer les valeurs nulles/négatives)
-    combined_df = combined_df.dropna(subset=['Volume'])
-    combined_df = combined_df[combined_df['Volume'] >= 0]
-    
-    
-    pivoted_df = combined_df.pivot_table(
-        index='Date', 
-        columns='Ticker', 
-        values='Volume', 
-        aggfunc='first'
-    )
-    
-    # Trier par date
-    pivoted_df = pivoted_df.sort_index()
-    
-    
-    return pivoted_df
+    df = df.dropna(subset=['Volume'])
+    df = df[df['Volume'] >= 0]
+
+    return df, time.perf_counter() - start
+
+
+def _print_read_timings(csv_files, results):
+    """Affiche le temps de lecture de chaque fichier."""
+    total = 0.0
+    for file, (df, elapsed) in zip(csv_files, results):
+        total += elapsed
+        rows = len(df) if df is not None else "ignoré"
+        print(f"📄 {Path(file).name}: {elapsed * 1000:.1f} ms ({rows} lignes)")
+    print(f"⏱️ Lecture cumulée: {total * 1000:.1f} ms sur {len(csv_files)} fichiers")
+
+
+# ======================= CACHE DISQUE DU PANEL =======================
+
+def _scan_files(csv_files):
+    """Taille et date de modification de chaque fichier source, par nom."""
+    file_stats = {}
+    for file in csv_files:
+        stat = os.stat(file)
+        file_stats[Path(file).name] = [stat.st_size, stat.st_mtime_ns]
+    return file_stats
+
+
+def _compute_cache_key(file_stats):
+    """Empreinte des fichiers sources (nom, taille, date de modification)."""
+    hasher = hashlib.sha1(f"v{CACHE_VERSION}".encode())
+    for name in sorted(file_stats):
+        size, mtime_ns = file_stats[name]
+        hasher.update(f"{name}|{size}|{mtime_ns}\n".encode())
+    return hasher.hexdigest()
+
+
+def _read_manifest(cache_path):
+    """Relit le manifest du cache (None s'il est absent ou illisible)."""
+    try:
+        with open(cache_path / "manifest.json", "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _read_panel_cache(cache_path, cache_key=None):
+    """
+    Relit le panel depuis le cache si sa clé correspond, sinon retourne None.
+    Sans cache_key, le panel est relu quelle que soit sa clé.
+    Les valeurs sont mappées en mémoire (lecture seule), sans copie ; seules
+    les manifest["rows"] premières dates sont visibles (le reste est la réserve).
+    """
+    manifest = _read_manifest(cache_path)
+    if manifest is None or manifest.get("version") != CACHE_VERSION:
+        return None
+    if cache_key is not None and manifest.get("key") != cache_key:
+        return None
+
+    try:
+        # Stocké champ par champ (fields x dates x tickers)
+        storage = np.load(cache_path / "values.npy", mmap_mode="r")
+        dates = np.load(cache_path / "dates.npy", mmap_mode="r")
+    except (OSError, ValueError):
+        # Cache corrompu ou incomplet : on reconstruit
+        return None
+
+    n_rows = manifest["rows"]
+    if storage.shape[1] < n_rows or len(dates) < n_rows:
+        return None
+    return MarketPanel(storage[:, :n_rows].transpose(1, 2, 0), np.array(dates[:n_rows]), manifest["tickers"], manifest["fields"])
+
+
+@contextmanager
+def _cache_lock(cache_path):
+    """Verrou exclusif sur le cache : un seul processus l'écrit à la fois."""
+    cache_path.mkdir(parents=True, exist_ok=True)
+    with open(cache_path / "cache.lock", "w") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _write_manifest(cache_path, cache_key, file_stats, n_rows, tickers, fields):
+    """Écrit le manifest du cache (fichier temporaire puis os.replace)."""
+    manifest_tmp = cache_path / f"manifest.json.{os.getpid()}.tmp"
+    with open(manifest_tmp, "w") as f:
+        json.dump({
+            "version": CACHE_VERSION,
+            "key": cache_key,
+            "files": file_stats,
+            "rows": n_rows,
+            "tickers": list(tickers),
+            "fields": list(fields)
+        }, f)
+    os.replace(manifest_tmp, cache_path / "manifest.json")
+
+
+def _write_panel_cache(cache_path, cache_key, file_stats, panel):
+    """
+    Écrit le panel dans le cache avec PANEL_GROWTH_ROWS dates en réserve
+    pour les ajouts (voir _append_panel_cache) ; le manifest est écrit en dernier.
+    """
+    try:
+        with _cache_lock(cache_path):
+            suffix = f".{os.getpid()}.tmp"
+            n_rows = len(panel.dates)
+            capacity = n_rows + PANEL_GROWTH_ROWS
+
+            # Écritures atomiques (fichier temporaire puis os.replace) pour que
+            # plusieurs workers démarrant en même temps ne lisent jamais un fichier partiel
+            values_tmp = cache_path / f"values.npy{suffix}"
+            shape = (len(panel.fields), capacity, len(panel.tickers))
+            storage = np.lib.format.open_memmap(str(values_tmp), mode="w+", dtype=panel.values.dtype, shape=shape)
+            storage[:, :n_rows] = panel.values.transpose(2, 0, 1)
+            storage[:, n_rows:] = np.nan
+            storage.flush()
+            del storage
+            os.replace(values_tmp, cache_path / "values.npy")
+
+            dates = np.full(capacity, np.datetime64("NaT"), dtype=panel.dates.values.dtype)
+            dates[:n_rows] = panel.dates.values
+            dates_tmp = cache_path / f"dates.npy{suffix}"
+            with open(dates_tmp, "wb") as f:
+                np.save(f, dates)
+            os.replace(dates_tmp, cache_path / "dates.npy")
+
+            _write_manifest(cache_path, cache_key, file_stats, n_rows, panel.tickers, panel.fields)
+    except OSError as e:
+        # Le cache est une optimisation : ne jamais bloquer le chargement
+        print(f"⚠️ Impossible d'écrire le cache du panel: {e}")
+
+
+def _append_panel_cache(cache_path, cache_key, file_stats, n_old, new_dates, block, tickers, fields):
+    """
+    Écrit les nouvelles lignes block (dates x tickers x champs) dans la
+    réserve du cache, juste après ses n_old dates, puis publie le manifest.
+
+    Les workers qui ont mappé le cache ne voient que les dates de leur
+    manifest : les lignes écrites au-delà ne les perturbent pas. Retourne
+    False sans rien écrire si le cache ne correspond pas au panel (autre
+    nombre de dates, autres tickers) ou si la réserve est pleine.
+    """
+    try:
+        with _cache_lock(cache_path):
+            manifest = _read_manifest(cache_path)
+            if (manifest is None or manifest.get("version") != CACHE_VERSION or manifest.get("rows") != n_old
+                    or manifest.get("tickers") != list(tickers) or manifest.get("fields") != list(fields)):
+                return False
+
+            n_new = n_old + len(new_dates)
+            storage = np.load(cache_path / "values.npy", mmap_mode="r+")
+            dates = np.load(cache_path / "dates.npy", mmap_mode="r+")
+            if storage.shape[1] < n_new or len(dates) < n_new:
+                return False
+
+            storage[:, n_old:n_new] = np.asarray(block, dtype=storage.dtype).transpose(2, 0, 1)
+            dates[n_old:n_new] = pd.DatetimeIndex(new_dates).values.astype(dates.dtype)
+            storage.flush()
+            dates.flush()
+            del storage, dates
+
+            _write_manifest(cache_path, cache_key, file_stats, n_new, tickers, fields)
+            return True
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Impossible de prolonger le cache du panel: {e}")
+        return False
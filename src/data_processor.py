@@ -1,5 +1,98 @@
 import pandas as pd
 import numpy as np
+from collections import OrderedDict
+import threading
+import weakref
+
+from rolling_stats import rolling_std
+
+# === SCHÉMA (TICKER, MÉTRIQUE) DES COLONNES ===
+# Métriques reconnues : les volumes (colonne = ticker) puis les suffixes dérivés
+SCHEMA_METRICS = ('volume', 'return', 'volatility')
+
+
+class ColumnSchema:
+    """
+    Index structuré (ticker, métrique) des colonnes d'un DataFrame traité,
+    construit une seule fois : chaque colonne reçoit un code de ticker et un
+    code de métrique, et les recherches usuelles (tous les rendements, la
+    volatilité d'un ticker) sont des accès O(1)
+    au lieu de parcourir df.columns avec endswith.
+    """
+
+    def __init__(self, columns):
+        """columns : colonnes du DataFrame (volumes, {ticker}_return, {ticker}_volatility)"""
+        self.columns_index = pd.Index(columns)
+        n_columns = len(self.columns_index)
+        self.metric_codes = np.zeros(n_columns, dtype=np.int8)
+        column_tickers = []
+
+        for i, column in enumerate(self.columns_index):
+            ticker = column
+            for code, metric in enumerate(SCHEMA_METRICS[1:], start=1):
+                suffix = f'_{metric}'
+                if isinstance(column, str) and column.endswith(suffix):
+                    ticker = column[:-len(suffix)]
+                    self.metric_codes[i] = code
+                    break
+            column_tickers.append(ticker)
+
+        codes, self.ticker_index = pd.factorize(pd.Index(column_tickers, dtype=object))
+        self.ticker_codes = codes.astype(np.int32)
+
+        self._positions = {
+            metric: np.flatnonzero(self.metric_codes == code)
+            for code, metric in enumerate(SCHEMA_METRICS)
+        }
+        self._tickers = {
+            metric: [column_tickers[i] for i in positions]
+            for metric, positions in self._positions.items()
+        }
+        self._columns = {
+            metric: self.columns_index[positions].tolist()
+            for metric, positions in self._positions.items()
+        }
+        self._lookup = {
+            (ticker, SCHEMA_METRICS[code]): i
+            for i, (ticker, code) in enumerate(zip(column_tickers, self.metric_codes))
+        }
+
+    def tickers(self, metric='volume'):
+        """Tickers ayant une colonne pour cette métrique (ordre des colonnes)."""
+        return self._tickers[metric]
+
+    def columns(self, metric):
+        """Noms des colonnes d'une métrique (ex: toutes les colonnes _return)."""
+        return self._columns[metric]
+
+    def positions(self, metric):
+        """Positions (entiers) des colonnes d'une métrique."""
+        return self._positions[metric]
+
+    def has(self, ticker, metric='volume'):
+        return (ticker, metric) in self._lookup
+
+    def position(self, ticker, metric='volume'):
+        """Position de la colonne (ticker, métrique), ou None si absente."""
+        return self._lookup.get((ticker, metric))
+
+
+_SCHEMAS = {}
+
+def schema_of(df):
+    """
+    ColumnSchema des colonnes de df, construit une fois par objet colonnes
+    (les colonnes pandas sont immuables) puis réutilisé à chaque appel.
+    """
+    columns = df.columns
+    key = id(columns)
+    entry = _SCHEMAS.get(key)
+    if entry is not None and entry[0]() is columns:
+        return entry[1]
+
+    schema = ColumnSchema(columns)
+    _SCHEMAS[key] = (weakref.ref(columns, lambda _, key=key: _SCHEMAS.pop(key, None)), schema)
+    return schema
 
 def compute_daily_returns(df):
     """
@@ -7,7 +100,8 @@ def compute_daily_returns(df):
     df: DataFrame avec dates en index, tickers en colonnes, volumes en valeurs
     """
     # Calculer les variations journalières de volume (en pourcentage)
-    returns_df = df.pct_change().fillna(0)
+    # Calcul en float64 quel que soit le type des volumes reçus
+    returns_df = df.astype('float64').pct_change().fillna(0)
     
     # Ajouter un préfixe pour distinguer les colonnes de rendement
     returns_df = returns_df.add_suffix('_return')
@@ -24,27 +118,167 @@ def compute_volatility(df, window=30):
     window: fenêtre glissante pour la volatilité
     """
     # Identifier les colonnes de volume (sans suffixe _return)
-    volume_cols = [col for col in df.columns if not col.endswith('_return')]
-    
-    # Calculer la volatilité glissante pour chaque ticker
-    volatility_data = {}
-    
-    for ticker in volume_cols:
-        if ticker in df.columns:
-            # Calculer les rendements si pas déjà fait
-            returns = df[ticker].pct_change().fillna(0)
-            # Volatilité = écart-type glissant des rendements
-            vol = returns.rolling(window=window, min_periods=1).std()
-            volatility_data[f'{ticker}_volatility'] = vol
+    volume_cols = schema_of(df).tickers()
     
+    # Calculer les rendements de tous les tickers en une fois
+    returns = df[volume_cols].astype('float64').pct_change().fillna(0)
+
+    # Volatilité = écart-type glissant des rendements (tous les tickers à la fois)
+    volatility = rolling_std(returns.to_numpy(), window)
+
     # Créer DataFrame de volatilité
-    volatility_df = pd.DataFrame(volatility_data, index=df.index)
+    volatility_df = pd.DataFrame(volatility, index=df.index, columns=[f'{ticker}_volatility' for ticker in volume_cols])
     
     # Combiner avec les données existantes
     result = pd.concat([df, volatility_df], axis=1)
     
     return result
 
+# === REGISTRE DES MÉTRIQUES DÉRIVÉES ===
+# nom -> (fonction, paramètres par défaut). Une métrique reçoit le registre
+# (DerivedMetrics), la liste de tickers et ses paramètres, et retourne un
+# tableau (dates x tickers) en float64.
+METRICS = {}
+
+def register_metric(name, **defaults):
+    """Décorateur : déclare une métrique dérivée calculable à la demande."""
+    def decorator(func):
+        METRICS[name] = (func, defaults)
+        return func
+    return decorator
+
+@register_metric('return')
+def _metric_return(metrics, tickers):
+    """Variations journalières des volumes (identique à compute_daily_returns)."""
+    volumes = pd.DataFrame(metrics.volume_values(tickers))
+    return volumes.pct_change().fillna(0).to_numpy()
+
+@register_metric('change')
+def _metric_change(metrics, tickers):
+    """Variation depuis la dernière valeur connue (les trous de cotation sont sautés)."""
+    volumes = pd.DataFrame(metrics.volume_values(tickers))
+    previous = volumes.shift(1).ffill()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (volumes / previous - 1).to_numpy()
+
+@register_metric('volatility', window=30)
+def _metric_volatility(metrics, tickers, window):
+    """Écart-type glissant des rendements (identique à compute_volatility)."""
+    return rolling_std(metrics.values(tickers, 'return'), window)
+
+
+class DerivedMetrics:
+    """
+    Volumes (dates x tickers) et métriques dérivées calculées à la demande.
+
+    Au lieu d'ajouter toutes les colonnes _return / _volatility au DataFrame,
+    chaque (ticker, métrique, paramètres) est calculé au premier accès,
+    pour tous les tickers manquants en une fois, puis gardé dans un cache LRU
+    borné (max_bytes) : les métriques inutilisées n'occupent pas de mémoire.
+    Le cache est partagé par les threads du serveur (accès protégés par un
+    verrou, les calculs se font hors du verrou).
+    """
+
+    def __init__(self, volumes, max_bytes=256 * 1024 ** 2):
+        """
+        volumes : DataFrame des volumes (dates en index, tickers en colonnes)
+        max_bytes : mémoire maximale du cache des métriques
+        """
+        self.volumes = volumes
+        self.index = volumes.index
+        self.tickers = volumes.columns.tolist()
+        self.max_bytes = max_bytes
+        self._ticker_pos = {ticker: i for i, ticker in enumerate(self.tickers)}
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def memory_usage(self):
+        """Mémoire occupée par le cache des métriques (octets)."""
+        return self._cache_bytes
+
+    def volume_values(self, tickers):
+        """Volumes (dates x tickers) en float64."""
+        positions = [self._ticker_pos[ticker] for ticker in tickers]
+        return self.volumes.to_numpy()[:, positions].astype(np.float64)
+
+    def values(self, tickers, metric, **params):
+        """
+        Tableau (dates x tickers) d'une métrique. Seuls les tickers absents
+        du cache sont calculés, en un seul appel vectorisé.
+        """
+        if metric not in METRICS:
+            raise KeyError(f"Métrique '{metric}' non déclarée. Métriques: {list(METRICS)}")
+        func, defaults = METRICS[metric]
+        params = {**defaults, **params}
+        param_key = tuple(sorted(params.items()))
+
+        columns = {}
+        with self._lock:
+            for ticker in tickers:
+                key = (ticker, metric, param_key)
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    columns[ticker] = self._cache[key]
+
+        missing = [ticker for ticker in dict.fromkeys(tickers) if ticker not in columns]
+        if missing:
+            computed = func(self, missing, **params)
+            for i, ticker in enumerate(missing):
+                columns[ticker] = self._store((ticker, metric, param_key), computed[:, i])
+
+        if not columns:
+            return np.empty((len(self.index), 0))
+        return np.column_stack([columns[ticker] for ticker in tickers])
+
+    def series(self, ticker, metric, **params):
+        """Série temporelle d'un (ticker, métrique)."""
+        return pd.Series(self.values([ticker], metric, **params)[:, 0], index=self.index, name=ticker)
+
+    def frame(self, metrics=('return',), tickers=None):
+        """
+        DataFrame au format de l'application : volumes puis une colonne
+        {ticker}_{métrique} par ticker et par métrique demandée.
+        """
+        tickers = self.tickers if tickers is None else list(tickers)
+        key = ("frame", tuple(metrics), tuple(tickers))
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        parts = [self.volumes[tickers]]
+        for metric in metrics:
+            parts.append(pd.DataFrame(self.values(tickers, metric), index=self.index,
+                                      columns=[f'{ticker}_{metric}' for ticker in tickers]))
+        frame = pd.concat(parts, axis=1)
+        return self._store(key, frame)
+
+    def _store(self, key, value):
+        """
+        Ajoute une entrée au cache LRU et évince les plus anciennes au-delà de
+        max_bytes. Si un autre thread a stocké la même clé entre-temps, son
+        entrée est gardée et retournée.
+        """
+        nbytes = _nbytes(value)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+            self._cache[key] = value
+            self._cache_bytes += nbytes
+
+            while self._cache_bytes > self.max_bytes and len(self._cache) > 1:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_bytes -= _nbytes(evicted)
+        return value
+
+def _nbytes(value):
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True).sum())
+    return value.nbytes
+
 def get_ticker_data(df, ticker, data_type='volume'):
     """
     Extrait les données d'un ticker spécifique.
@@ -76,4 +310,4 @@ def get_available_tickers(df):
     """
     Retourne la liste des tickers disponibles (colonnes sans suffixe).
     """
-    return [col for col in df.columns if not col.endswith(('_return', '_volatility'))]
+    return list(schema_of(df).tickers())
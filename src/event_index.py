@@ -0,0 +1,103 @@
+import pandas as pd
+import numpy as np
+import weakref
+
+# Plus grande fenêtre (jours) précalculée autour de chaque événement
+EVENT_MAX_WINDOW = 30
+
+# Unités de fenêtre : jours calendaires (±N jours) ou jours de bourse (±N lignes)
+DAY_UNITS = ('calendar', 'trading')
+
+
+class EventIndex:
+    """
+    Index positionnel des événements dans un index de dates trié.
+
+    Pour chaque événement, les bornes (positions de lignes) de toutes les
+    fenêtres ±k jours calendaires (k <= max_window) sont trouvées une fois
+    par recherche binaire. Extraire une fenêtre devient une tranche contiguë
+    (slice) au lieu de tester chaque date avec `date in df.index`.
+    En jours de bourse, la fenêtre ±N correspond aux N lignes de part et
+    d'autre de la première séance à partir de la date de l'événement.
+    """
+
+    def __init__(self, index, events, max_window=EVENT_MAX_WINDOW):
+        """
+        index : DatetimeIndex trié (lignes du panel ou du DataFrame)
+        events : liste des événements avec name et date
+        max_window : plus grande fenêtre précalculée (jours calendaires)
+        """
+        self.index = index
+        self.max_window = max_window
+        self.names = [e['name'] for e in events]
+        self.dates = pd.DatetimeIndex([pd.to_datetime(e['date']) for e in events])
+        self._event_pos = {name: i for i, name in enumerate(self.names)}
+
+        dates = pd.DatetimeIndex(self.index).to_numpy()
+        event_dates = self.dates.to_numpy().astype(dates.dtype)
+        days = np.arange(max_window + 1) * np.timedelta64(1, 'D')
+
+        # Bornes calendaires [date - k jours, date + k jours] pour k = 0..max_window
+        self._calendar_lo = np.searchsorted(dates, event_dates[:, None] - days, side='left')
+        self._calendar_hi = np.searchsorted(dates, event_dates[:, None] + days, side='right')
+
+        # Séance de référence (jour 0 en jours de bourse) : première ligne >= date de l'événement
+        self.anchors = self._calendar_lo[:, 0]
+
+    def __contains__(self, name):
+        return name in self._event_pos
+
+    def calendar_slice(self, name, before, after=None):
+        """Lignes dont la date est dans [date - before jours, date + after jours]."""
+        after = before if after is None else after
+        i = self._event_pos[name]
+        if before <= self.max_window:
+            lo = self._calendar_lo[i, before]
+        else:
+            lo = self.index.searchsorted(self.dates[i] - pd.Timedelta(days=before), side='left')
+        if after <= self.max_window:
+            hi = self._calendar_hi[i, after]
+        else:
+            hi = self.index.searchsorted(self.dates[i] + pd.Timedelta(days=after), side='right')
+        return slice(int(lo), int(hi))
+
+    def trading_slice(self, name, before, after=None):
+        """Lignes de -before à +after séances autour de la séance de l'événement."""
+        after = before if after is None else after
+        anchor = int(self.anchors[self._event_pos[name]])
+        if anchor >= len(self.index):
+            return slice(len(self.index), len(self.index))
+        return slice(max(anchor - before, 0), min(anchor + after + 1, len(self.index)))
+
+    def window(self, name, before, after=None, day_unit='calendar'):
+        """Tranche de lignes de la fenêtre, en jours calendaires ou en jours de bourse."""
+        if day_unit == 'trading':
+            return self.trading_slice(name, before, after)
+        return self.calendar_slice(name, before, after)
+
+    def offsets(self, name, rows, day_unit='calendar'):
+        """Décalages (jours calendaires ou séances) des lignes rows par rapport à l'événement."""
+        i = self._event_pos[name]
+        if day_unit == 'trading':
+            return np.arange(rows.start, rows.stop) - int(self.anchors[i])
+        return ((self.index[rows] - self.dates[i]) // pd.Timedelta(days=1)).to_numpy()
+
+
+_EVENT_INDEXES = {}
+
+def event_index_of(df, events, max_window=EVENT_MAX_WINDOW):
+    """
+    EventIndex des événements sur l'index de df, construit une fois par
+    objet index (les index pandas sont immuables) et par liste d'événements.
+    """
+    index = df.index
+    key = id(index)
+    entry = _EVENT_INDEXES.get(key)
+    if entry is None or entry[0]() is not index:
+        entry = (weakref.ref(index, lambda _, key=key: _EVENT_INDEXES.pop(key, None)), {})
+        _EVENT_INDEXES[key] = entry
+
+    events_key = (tuple((e['name'], str(e['date'])) for e in events), max_window)
+    if events_key not in entry[1]:
+        entry[1][events_key] = EventIndex(index, events, max_window)
+    return entry[1][events_key]
@@ -0,0 +1,161 @@
+import pandas as pd
+import numpy as np
+import hashlib
+
+from event_index import EventIndex, EVENT_MAX_WINDOW
+from shared_data import load_shared_arrays
+
+
+class EventTensor:
+    """
+    Tenseur matérialisé (événement x ticker x décalage x métrique).
+
+    La heatmap et la vue volatilité posent la même question : la valeur de
+    la métrique M pour le ticker T au décalage k de l'événement E. Le
+    tenseur est construit une fois au démarrage (un gather vectorisé par
+    métrique) pour k = -max_offset..+max_offset ; un changement de slider
+    devient une simple tranche, sans parcourir l'historique.
+
+    En jours calendaires, le décalage k correspond à la date de l'événement
+    + k jours (NaN si le marché est fermé ce jour-là) ; en jours de bourse,
+    à la k-ième séance autour de la séance de l'événement.
+
+    Le tenseur n'est qu'une copie précalculée : le calcul sur le DataFrame
+    fait foi. Les vues ne le lisent que si covers() confirme qu'il a été
+    construit sur le même index et les mêmes tickers, et recalculent depuis
+    df sinon (source à la demande, événement ou fenêtre hors tenseur).
+    """
+
+    def __init__(self, index, tickers, layers, events, max_offset=EVENT_MAX_WINDOW, day_unit='calendar'):
+        """
+        index : DatetimeIndex trié des lignes des couches
+        tickers : tickers (colonnes des couches)
+        layers : dict métrique -> tableau (dates x tickers), ex: 'return',
+                 ('volatility', 7) pour la volatilité sur 7 jours
+        events : liste des événements avec name et date
+        max_offset : décalage maximal matérialisé de part et d'autre
+        day_unit : "calendar" ou "trading"
+        """
+        self._init_axes(index, tickers, list(layers), events, max_offset, day_unit)
+        event_index = EventIndex(index, events, max_offset)
+
+        # Position de chaque (événement, décalage) dans l'index, -1 si absente
+        if day_unit == 'trading':
+            positions = event_index.anchors[:, None] + self.offsets
+            positions[(positions < 0) | (positions >= len(index)) | (event_index.anchors[:, None] >= len(index))] = -1
+            dates = np.where(positions >= 0, index.to_numpy()[np.clip(positions, 0, max(len(index) - 1, 0))],
+                             np.datetime64('NaT'))
+        else:
+            dates = event_index.dates.to_numpy()[:, None] + self.offsets * np.timedelta64(1, 'D')
+            positions = index.get_indexer(dates.ravel()).reshape(dates.shape)
+        self.positions = positions
+        self.present = positions >= 0
+        self.dates = pd.DatetimeIndex(dates.ravel()).to_numpy().reshape(dates.shape)
+
+        # Gather vectorisé : une ligne de NaN en fin de couche pour les positions absentes
+        shape = (len(self._event_pos), len(self.tickers), len(self.offsets), len(self.metrics))
+        self.values = np.empty(shape)
+        for m, layer in enumerate(layers.values()):
+            padded = np.vstack([np.asarray(layer, dtype=np.float64), np.full((1, len(self.tickers)), np.nan)])
+            self.values[..., m] = padded[positions].transpose(0, 2, 1)
+
+    def _init_axes(self, index, tickers, metrics, events, max_offset, day_unit):
+        self.index = index
+        self.tickers = list(tickers)
+        self.metrics = metrics
+        self.max_offset = max_offset
+        self.day_unit = day_unit
+        self.offsets = np.arange(-max_offset, max_offset + 1)
+        self._metric_pos = {metric: i for i, metric in enumerate(self.metrics)}
+        self._event_pos = {event['name']: i for i, event in enumerate(events)}
+
+    @classmethod
+    def from_arrays(cls, index, tickers, metrics, events, arrays, max_offset=EVENT_MAX_WINDOW, day_unit='calendar'):
+        """Tenseur reconstruit à partir de tableaux publiés (voir arrays), sans nouveau gather."""
+        tensor = cls.__new__(cls)
+        tensor._init_axes(index, tickers, list(metrics), events, max_offset, day_unit)
+        tensor.positions = arrays['positions']
+        tensor.present = arrays['present']
+        tensor.dates = arrays['dates']
+        tensor.values = arrays['values']
+        return tensor
+
+    @property
+    def arrays(self):
+        """Tableaux du tenseur (dict nom -> tableau), à publier avec shared_data.publish_arrays."""
+        return {'positions': self.positions, 'present': self.present, 'dates': self.dates, 'values': self.values}
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes
+
+    def covers(self, df, event_name, window, metric, tickers=None):
+        """Vrai si le tenseur répond pour ce DataFrame (même index), cet événement, cette fenêtre et cette métrique."""
+        return (event_name in self._event_pos and 0 <= window <= self.max_offset
+                and metric in self._metric_pos
+                and len(df.index) == len(self.index) and df.index.equals(self.index)
+                and (tickers is None or list(tickers) == self.tickers))
+
+    def _offset_slice(self, first, last):
+        """Tranche des décalages first..last (inclus), dans -max_offset..+max_offset."""
+        if not -self.max_offset <= first <= last + 1 or last > self.max_offset:
+            raise ValueError(f"Décalages {first}..{last} hors du tenseur (±{self.max_offset})")
+        return slice(self.max_offset + first, self.max_offset + last + 1)
+
+    def _window_slice(self, before, after):
+        """Tranche des décalages -before..+after (before et after positifs ou nuls)."""
+        after = before if after is None else after
+        if before < 0 or after < 0:
+            raise ValueError(f"Fenêtre invalide (before={before}, after={after}) : before et after doivent être "
+                             "positifs ou nuls")
+        return self._offset_slice(-before, after)
+
+    def slice(self, event_name, metric, before, after=None):
+        """Tableau (tickers x décalages -before..+after) d'une métrique, sans copie."""
+        return self.values[self._event_pos[event_name], :, self._window_slice(before, after), self._metric_pos[metric]]
+
+    def window_present(self, event_name, before, after=None):
+        """Décalages -before..+after présents dans l'index (séance ouverte)."""
+        return self.present[self._event_pos[event_name], self._window_slice(before, after)]
+
+    def window_dates(self, event_name, before, after=None):
+        """Dates des décalages -before..+after (NaT hors index en jours de bourse)."""
+        return self.dates[self._event_pos[event_name], self._window_slice(before, after)]
+
+
+def build_event_tensors(derived, events, vol_cube=None, max_offset=EVENT_MAX_WINDOW, day_units=('calendar',),
+                        shared_path=None, data_version=None):
+    """
+    Tenseurs des événements (un par unité de jours de day_units) à partir
+    d'un registre DerivedMetrics : rendements et, si vol_cube est fourni,
+    volatilités de toutes ses fenêtres (les couches lues par la heatmap et
+    la vue volatilité ; la choroplèthe et la comparaison passent par les
+    sommes préfixes, voir aggregates.py).
+
+    shared_path : préfixe de publication (voir shared_data.load_shared_arrays) ;
+    les tenseurs sont alors construits une fois et partagés entre les workers.
+    """
+    tickers = derived.tickers
+    layers = {'return': derived.values(tickers, 'return')}
+    if vol_cube is not None and list(vol_cube.columns) == tickers and vol_cube.index.equals(derived.index):
+        for window in vol_cube.windows:
+            layers[('volatility', window)] = vol_cube.get(window)
+
+    if shared_path is None:
+        return {
+            day_unit: EventTensor(derived.index, tickers, layers, events, max_offset, day_unit)
+            for day_unit in day_units
+        }
+
+    # La publication dépend aussi des événements et des couches, pas seulement des données
+    layout = repr(([(e['name'], str(e['date'])) for e in events], list(layers), tickers, max_offset))
+    version = f"{data_version}:{hashlib.md5(layout.encode()).hexdigest()}"
+    tensors = {}
+    for day_unit in day_units:
+        arrays = load_shared_arrays(
+            f"{shared_path}.{day_unit}",
+            lambda: EventTensor(derived.index, tickers, layers, events, max_offset, day_unit).arrays,
+            version
+        )
+        tensors[day_unit] = EventTensor.from_arrays(derived.index, tickers, layers, events, arrays, max_offset, day_unit)
+    return tensors
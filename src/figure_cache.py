@@ -0,0 +1,97 @@
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class FigureCache:
+    """
+    Cache LRU des figures construites par les callbacks, borné en mémoire.
+
+    La clé est la vue plus ses entrées normalisées (7 et 7.0 donnent la même
+    clé), préfixée par la version des données lue au démarrage. Les données
+    ne sont pas rechargées en cours de route : après refresh_data.py, il faut
+    redémarrer l'application (et donc repartir d'un cache vide). La taille d'une figure est
+    celle de son JSON ; les figures les moins récemment servies sont
+    évincées au-delà de max_bytes. Les compteurs hits/misses mesurent
+    l'efficacité du cache.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 ** 2, version=None):
+        """
+        max_bytes : mémoire maximale des figures gardées (taille JSON)
+        version : version des données (ex: data_loader.get_data_version())
+        """
+        self.max_bytes = max_bytes
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self.memory_usage = 0
+        self._figures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._figures)
+
+    def key(self, view, *inputs):
+        """Clé du cache d'une vue et de ses entrées."""
+        return (self.version, view, _normalize(inputs))
+
+    def get_or_build(self, view, build, *inputs):
+        """Figure de la vue pour ces entrées : lue dans le cache, sinon construite par build()."""
+        key = self.key(view, *inputs)
+        with self._lock:
+            entry = self._figures.get(key)
+            if entry is not None:
+                self._figures.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        # Construction hors du verrou : les autres vues restent servies pendant ce temps
+        fig = build()
+        nbytes = len(fig.to_json()) if hasattr(fig, 'to_json') else len(json.dumps(fig, default=str))
+        if nbytes > self.max_bytes:
+            return fig
+
+        with self._lock:
+            if key not in self._figures:
+                self._figures[key] = (fig, nbytes)
+                self.memory_usage += nbytes
+            while self.memory_usage > self.max_bytes:
+                _, (_, evicted) = self._figures.popitem(last=False)
+                self.memory_usage -= evicted
+        return fig
+
+    def clear(self):
+        with self._lock:
+            self._figures.clear()
+            self.memory_usage = 0
+
+    def stats(self):
+        """Compteurs du cache (hits, misses, taux de succès, nombre et taille des figures)."""
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'version': self.version,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / requests if requests else 0.0,
+                'entries': len(self._figures),
+                'memory_usage': self.memory_usage,
+                'max_bytes': self.max_bytes,
+            }
+
+
+def _normalize(value):
+    """Entrées d'un callback sous forme hashable et canonique (7.0 -> 7, listes -> tuples)."""
+    if isinstance(value, (list, tuple)):
+        return tuple(_normalize(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _normalize(v)) for k, v in value.items()))
+    if isinstance(value, (np.integer, np.floating)):
+        value = value.item()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
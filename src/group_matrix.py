@@ -0,0 +1,82 @@
+import numpy as np
+
+# Colonnes des statistiques par ticker (voir ticker_stats)
+STAT_SUM, STAT_COUNT, STAT_POS_INF, STAT_NEG_INF = range(4)
+
+
+class GroupMatrix:
+    """
+    Matrice d'appartenance ticker -> groupe (groupes x tickers, 1 si le
+    ticker fait partie du groupe).
+
+    Les groupes viennent d'un mapping nom -> tickers : régions de
+    config/tickers.json, regions_map de app.py, classes d'actifs, paniers
+    personnalisés... Les agrégats de tous les groupes sont alors un seul
+    produit matriciel avec les statistiques par ticker, quel que soit le
+    nombre de groupes.
+    """
+
+    def __init__(self, groups, tickers):
+        """
+        groups : dict nom du groupe -> liste de tickers
+        tickers : tickers (colonnes de la matrice), les membres inconnus sont ignorés
+        """
+        self.names = list(groups)
+        self.tickers = list(tickers)
+        ticker_pos = {ticker: i for i, ticker in enumerate(self.tickers)}
+
+        self.matrix = np.zeros((len(self.names), len(self.tickers)))
+        for g, members in enumerate(groups.values()):
+            cols = [ticker_pos[ticker] for ticker in members if ticker in ticker_pos]
+            self.matrix[g, cols] = 1.0
+        self._member = self.matrix > 0
+
+    def counts(self, mask):
+        """Nombre de tickers de chaque groupe pour lesquels mask (un booléen par ticker) est vrai."""
+        return self.matrix @ np.asarray(mask, dtype=np.float64)
+
+    def members(self, mask=None):
+        """Tickers (triés) de chaque groupe, restreints à ceux pour lesquels mask est vrai."""
+        selected = self._member if mask is None else self._member & np.asarray(mask, dtype=bool)
+        return [sorted(self.tickers[i] for i in np.flatnonzero(row)) for row in selected]
+
+    def pooled_means(self, stats):
+        """
+        Moyenne de toutes les valeurs des tickers de chaque groupe, à partir
+        des statistiques par ticker (tickers x 4, voir ticker_stats).
+        NaN si aucune valeur ; les ±inf suivent pandas (inf, -inf, ou NaN
+        si les deux sont présents).
+        """
+        totals = self.matrix @ stats
+        total, count = totals[:, STAT_SUM], totals[:, STAT_COUNT]
+        pos_inf, neg_inf = totals[:, STAT_POS_INF], totals[:, STAT_NEG_INF]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(count > 0, total / count, np.nan)
+        return np.where(pos_inf > 0, np.where(neg_inf > 0, np.nan, np.inf), np.where(neg_inf > 0, -np.inf, mean))
+
+
+def ticker_stats(values):
+    """
+    Statistiques par ticker d'un tableau (tickers x lignes), NaN = valeur
+    absente : somme des valeurs finies, nombre de valeurs, nombre de +inf
+    et de -inf (tickers x 4).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    finite = np.isfinite(values)
+    return np.column_stack([
+        np.where(finite, values, 0.0).sum(axis=1),
+        (~np.isnan(values)).sum(axis=1),
+        (values == np.inf).sum(axis=1),
+        (values == -np.inf).sum(axis=1),
+    ]).astype(np.float64)
+
+
+_GROUP_MATRICES = {}
+
+def group_matrix_of(groups, tickers):
+    """GroupMatrix construite une fois par mapping de groupes et liste de tickers."""
+    key = (tuple((name, tuple(members)) for name, members in groups.items()), tuple(tickers))
+    matrix = _GROUP_MATRICES.get(key)
+    if matrix is None:
+        matrix = _GROUP_MATRICES[key] = GroupMatrix(groups, tickers)
+    return matrix
@@ -727,6 +727,17 @@ def _create_compare_controls(categories_list):
                     },
                     tooltip={'placement': 'bottom', 'always_visible': True},
                     updatemode='drag'
+                ),
+                dcc.RadioItems(
+                    id='compare-days-radio',
+                    options=[
+                        {'label': ' Jours calendaires', 'value': 'calendar'},
+                        {'label': ' Jours de bourse', 'value': 'trading'}
+                    ],
+                    value='calendar',
+                    inline=True,
+                    style={'fontSize': '13px', 'marginTop': '10px'},
+                    labelStyle={'marginRight': '12px'}
                 )
             ])
         ])
@@ -0,0 +1,140 @@
+import pandas as pd
+from pathlib import Path
+from collections import OrderedDict
+import glob
+import re
+import threading
+
+from data_loader import load_market_data, load_market_files
+from data_processor import compute_daily_returns, compute_volatility
+
+# Marge (jours calendaires) chargée avant/après une fenêtre pour que les
+# rendements et la volatilité glissante (30 jours de bourse) soient identiques
+# à ceux calculés sur tout l'historique
+LAZY_PADDING_DAYS = 60
+
+
+class LazyMarketDataset:
+    """
+    Données de marché chargées à la demande, partition par partition.
+
+    Les fichiers annuels (AAAA_Global_Markets_Data.csv) servent de partitions :
+    une requête ne lit que les années couvertes par sa plage de dates.
+    Les partitions et les DataFrames traités (volumes, _return, _volatility)
+    sont gardés dans un cache LRU borné en mémoire (max_bytes), partagé par
+    les threads du serveur (accès protégés par un verrou).
+    """
+
+    def __init__(self, data_dir="data", pattern="*_Glob*l_Markets_Data.csv", max_bytes=512 * 1024 ** 2):
+        self.data_dir = data_dir
+        self.pattern = pattern
+        self.max_bytes = max_bytes
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+
+        # Partitions : année -> fichier, d'après le préfixe du nom de fichier
+        self.partitions = {}
+        for file in sorted(glob.glob(str(Path(data_dir) / pattern))):
+            match = re.match(r"(\d{4})_", Path(file).name)
+            if match:
+                self.partitions.setdefault(int(match.group(1)), []).append(file)
+
+        if not self.partitions:
+            raise FileNotFoundError(f"Aucun fichier annuel trouvé avec le pattern {pattern} dans {data_dir}")
+
+    @property
+    def tickers(self):
+        """Tickers de la partition la plus récente."""
+        return self._partition(max(self.partitions)).columns.tolist()
+
+    @property
+    def memory_usage(self):
+        """Mémoire occupée par le cache LRU (octets)."""
+        return self._cache_bytes
+
+    def full(self):
+        """
+        Volumes sur tout l'historique (vue polaire). Passe par le cache disque
+        de load_market_data : le panel est mappé en mémoire, hors du LRU.
+        """
+        return load_market_data(self.data_dir, self.pattern)
+
+    def history(self, ticker):
+        """Historique complet des volumes pour la vue polaire (vue sans copie, tous tickers)."""
+        return self.full()
+
+    def window(self, start, end):
+        """DataFrame traité couvrant [start, end] (plus la marge de calcul)."""
+        start, end = pd.Timestamp(start), pd.Timestamp(end)
+        dates = [start, end, *pd.date_range(start, end, freq='YS')]
+        return self.frame_for(dates)
+
+    def frame_for(self, dates, pad_days=0):
+        """
+        DataFrame traité (volumes, _return, _volatility) contenant toutes les
+        partitions nécessaires aux dates ± pad_days (plus LAZY_PADDING_DAYS).
+        """
+        if len(dates) == 0:
+            return pd.DataFrame()
+
+        pad = pd.Timedelta(days=pad_days + LAZY_PADDING_DAYS)
+        years = set()
+        for date in dates:
+            date = pd.Timestamp(date)
+            years.update(range((date - pad).year, (date + pad).year + 1))
+        years = tuple(sorted(year for year in years if year in self.partitions))
+
+        if not years:
+            return pd.DataFrame()
+
+        key = ("frame", years)
+        frame = self._lookup(key)
+        if frame is not None:
+            return frame
+
+        # Construction hors du verrou : les autres requêtes restent servies pendant ce temps
+        volumes = pd.concat([self._partition(year) for year in years]).sort_index()
+        volumes = volumes[~volumes.index.duplicated(keep='first')]
+        volumes = volumes.reindex(columns=sorted(volumes.columns))
+        volumes.columns.name = 'Ticker'
+
+        frame = compute_volatility(compute_daily_returns(volumes))
+        return self._store(key, frame)
+
+    def _partition(self, year):
+        """Volumes (dates x tickers) d'une année, lus à la demande."""
+        key = ("partition", year)
+        volumes = self._lookup(key)
+        if volumes is not None:
+            return volumes
+
+        volumes = load_market_files(self.partitions[year]).field('Volume')
+        return self._store(key, volumes)
+
+    def _lookup(self, key):
+        """Entrée du cache LRU (marquée comme la plus récente), ou None."""
+        with self._lock:
+            frame = self._cache.get(key)
+            if frame is not None:
+                self._cache.move_to_end(key)
+            return frame
+
+    def _store(self, key, frame):
+        """
+        Ajoute une entrée au cache LRU et évince les plus anciennes au-delà de
+        max_bytes. Si un autre thread a stocké la même clé entre-temps, son
+        entrée est gardée et retournée.
+        """
+        nbytes = int(frame.memory_usage(index=True).sum())
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+            self._cache[key] = frame
+            self._cache_bytes += nbytes
+
+            while self._cache_bytes > self.max_bytes and len(self._cache) > 1:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_bytes -= int(evicted.memory_usage(index=True).sum())
+        return frame
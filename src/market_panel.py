@@ -0,0 +1,162 @@
+import pandas as pd
+import numpy as np
+
+# Champs OHLCV présents dans les CSV de marché
+PANEL_FIELDS = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+
+# Dates réservées en fin de stockage pour les ajouts quotidiens (environ un an de séances)
+PANEL_GROWTH_ROWS = 256
+
+# Type de stockage du panel : les volumes dépassent largement 2**24 (plus grand
+# entier exact en float32) et la variation entre deux volumes voisins perdrait
+# ses derniers chiffres significatifs si les volumes étaient arrondis au stockage
+PANEL_DTYPE = np.float64
+
+
+class MarketPanel:
+    """
+    Panel compact de données de marché : dates x tickers x champs (float64).
+
+    Toutes les données OHLCV tiennent dans une seule allocation. Le tableau est
+    rangé champ par champ en mémoire, de sorte que field('Volume') ou
+    field('Close') soit une vue contiguë (dates x tickers), sans copie.
+    """
+
+    def __init__(self, values, dates, tickers, fields):
+        """
+        values : tableau de forme (n_dates, n_tickers, n_fields)
+        dates : dates triées (index des lignes)
+        tickers : noms des tickers
+        fields : noms des champs (ex: PANEL_FIELDS)
+        """
+        self.values = values
+        self.dates = pd.DatetimeIndex(dates, name='Date')
+        self.tickers = pd.Index(tickers, name='Ticker')
+        self.fields = list(fields)
+        self._field_pos = {field: i for i, field in enumerate(self.fields)}
+        # Stockage (champs x capacité x tickers) prolongeable en place (voir append)
+        self._storage = None
+        self._extent = None
+
+    @classmethod
+    def allocate(cls, dates, tickers, fields=PANEL_FIELDS, dtype=PANEL_DTYPE, capacity=None):
+        """
+        Alloue un panel rempli de NaN, rangé champ par champ en mémoire.
+        capacity : nombre de dates réservées (au moins len(dates)) ; les dates
+        en réserve permettent des ajouts sans recopier le panel.
+        """
+        n_dates = len(dates)
+        storage = np.full((len(fields), max(capacity or n_dates, n_dates), len(tickers)), np.nan, dtype=dtype)
+        return cls._over(storage, [n_dates], dates, tickers, fields)
+
+    @classmethod
+    def _over(cls, storage, extent, dates, tickers, fields):
+        """Panel des extent[0] premières dates d'un stockage (champs x capacité x tickers)."""
+        panel = cls(storage[:, :extent[0]].transpose(1, 2, 0), dates, tickers, fields)
+        panel._storage, panel._extent = storage, extent
+        return panel
+
+    @classmethod
+    def from_long(cls, long_df, fields=PANEL_FIELDS, dtype=PANEL_DTYPE):
+        """
+        Construit le panel à partir d'un DataFrame long [Ticker, Date, champs...].
+        En cas de doublon (Ticker, Date), la première ligne est conservée.
+        """
+        long_df = long_df.drop_duplicates(subset=['Date', 'Ticker'], keep='first')
+
+        date_codes, dates = pd.factorize(long_df['Date'], sort=True)
+        ticker_codes, tickers = pd.factorize(long_df['Ticker'], sort=True)
+
+        panel = cls.allocate(dates, tickers, fields, dtype)
+        for field in fields:
+            if field in long_df.columns:
+                panel.field_values(field)[date_codes, ticker_codes] = long_df[field].to_numpy(dtype=dtype)
+        return panel
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes
+
+    def field_values(self, field):
+        """Tableau (dates x tickers) d'un champ, vue sans copie."""
+        if field not in self._field_pos:
+            raise KeyError(f"Champ '{field}' non disponible. Champs: {self.fields}")
+        return self.values[:, :, self._field_pos[field]]
+
+    def field(self, field):
+        """DataFrame (dates x tickers) d'un champ, adossé au panel (sans copie)."""
+        return pd.DataFrame(self.field_values(field), index=self.dates, columns=self.tickers, copy=False)
+
+    def ticker(self, ticker):
+        """DataFrame (dates x champs) d'un ticker, adossé au panel (sans copie)."""
+        pos = self.tickers.get_loc(ticker)
+        return pd.DataFrame(self.values[:, pos, :], index=self.dates, columns=self.fields, copy=False)
+
+    def series(self, ticker, field):
+        """Série temporelle d'un (ticker, champ), vue sans copie."""
+        pos = self.tickers.get_loc(ticker)
+        return pd.Series(self.field_values(field)[:, pos], index=self.dates, name=ticker, copy=False)
+
+    def window(self, start, end):
+        """Sous-panel des dates comprises entre start et end (incluses), sans copie."""
+        lo = self.dates.searchsorted(pd.Timestamp(start), side='left')
+        hi = self.dates.searchsorted(pd.Timestamp(end), side='right')
+        return MarketPanel(self.values[lo:hi], self.dates[lo:hi], self.tickers, self.fields)
+
+    def new_rows(self, long_df):
+        """
+        Lignes de long_df [Ticker, Date, champs...] prêtes à être ajoutées :
+        (DatetimeIndex des nouvelles dates, tableau dates x tickers x champs).
+        Les dates doivent toutes être postérieures à la dernière date du panel
+        et les tickers déjà connus (sinon ValueError / KeyError).
+        """
+        long_df = long_df.drop_duplicates(subset=['Date', 'Ticker'], keep='first')
+
+        date_codes, new_dates = pd.factorize(long_df['Date'], sort=True)
+        if len(new_dates) and len(self.dates) and new_dates[0] <= self.dates[-1]:
+            raise ValueError(f"Les nouvelles lignes doivent être postérieures au {self.dates[-1]:%Y-%m-%d}")
+
+        ticker_codes = self.tickers.get_indexer(long_df['Ticker'])
+        if (ticker_codes < 0).any():
+            unknown = sorted(set(long_df['Ticker'][ticker_codes < 0]))
+            raise KeyError(f"Tickers absents du panel: {unknown}")
+
+        block = np.full((len(new_dates), len(self.tickers), len(self.fields)), np.nan, dtype=self.values.dtype)
+        for i, field in enumerate(self.fields):
+            if field in long_df.columns:
+                block[date_codes, ticker_codes, i] = long_df[field].to_numpy(dtype=self.values.dtype)
+        return pd.DatetimeIndex(new_dates), block
+
+    def append(self, dates, block):
+        """
+        Retourne un nouveau panel prolongé des lignes block (dates x tickers x champs).
+
+        Les lignes sont écrites dans la réserve du stockage quand elle suffit :
+        le coût ne dépend que du nombre de nouvelles lignes. Sinon (réserve
+        pleine, panel en lecture seule ou déjà prolongé) le stockage est
+        réalloué avec PANEL_GROWTH_ROWS dates de réserve. Le panel courant
+        reste valide : il ne voit que ses propres dates.
+        """
+        n_old = len(self.dates)
+        n_new = n_old + len(dates)
+        storage, extent = self._storage, self._extent
+        if storage is None or extent[0] != n_old or storage.shape[1] < n_new:
+            storage = np.full((len(self.fields), n_new + PANEL_GROWTH_ROWS, len(self.tickers)), np.nan,
+                              dtype=self.values.dtype)
+            storage[:, :n_old] = self.values.transpose(2, 0, 1)
+            extent = [n_old]
+
+        storage[:, n_old:n_new] = np.asarray(block, dtype=storage.dtype).transpose(2, 0, 1)
+        extent[0] = n_new
+        return MarketPanel._over(storage, extent, self.dates.append(pd.DatetimeIndex(dates)), self.tickers, self.fields)
+
+    def append_long(self, long_df):
+        """
+        Retourne un nouveau panel prolongé des lignes de long_df [Ticker, Date, champs...]
+        (voir new_rows et append).
+        """
+        return self.append(*self.new_rows(long_df))
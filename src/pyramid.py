@@ -0,0 +1,54 @@
+import pandas as pd
+
+# Niveaux de résolution, du plus fin au plus grossier : (nom, règle de resample, jours par point)
+# ('ME' = fin de mois, alias de pandas >= 2.2, voir requirements.txt)
+PYRAMID_TIERS = [
+    ('D', None, 1),
+    ('W', 'W-FRI', 7),
+    ('M', 'ME', 30),
+]
+
+
+class ResolutionPyramid:
+    """
+    Pyramide de résolutions du panel (journalier, hebdomadaire, mensuel),
+    calculée une fois au chargement. Chaque niveau garde la moyenne et la
+    somme par période ; un graphique choisit le niveau le plus grossier qui
+    donne encore assez de points sur la période affichée.
+    """
+
+    def __init__(self, df, tiers=PYRAMID_TIERS):
+        """
+        df : DataFrame journalier (dates en index, tickers en colonnes)
+        tiers : liste (nom, règle pandas ou None pour le niveau de base, jours par point)
+        """
+        self.tiers = {}
+        for name, rule, days in tiers:
+            if rule is None:
+                mean, total = df, df
+            else:
+                resampler = df.resample(rule)
+                mean, total = resampler.mean(), resampler.sum(min_count=1)
+            self.tiers[name] = {'mean': mean, 'sum': total, 'days': days}
+
+    def frame(self, tier, how='mean'):
+        """DataFrame d'un niveau ('mean' ou 'sum')."""
+        return self.tiers[tier][how]
+
+    def days(self, tier):
+        """Nombre de jours représentés par un point du niveau."""
+        return self.tiers[tier]['days']
+
+    def select(self, start=None, end=None, min_points=720):
+        """
+        Nom du niveau le plus grossier ayant au moins min_points points entre
+        start et end (tout l'historique par défaut) ; à défaut le plus fin.
+        """
+        names = list(self.tiers)
+        for name in reversed(names):
+            index = self.tiers[name]['mean'].index
+            lo = 0 if start is None else index.searchsorted(pd.Timestamp(start), side='left')
+            hi = len(index) if end is None else index.searchsorted(pd.Timestamp(end), side='right')
+            if hi - lo >= min_points:
+                return name
+        return names[0]
@@ -0,0 +1,21 @@
+import sys
+
+from data_loader import refresh_market_panel
+
+
+def main(data_dir="data"):
+    """
+    Mise à jour quotidienne du cache des données de marché : seules les
+    lignes postérieures à la dernière date du cache sont lues et ajoutées
+    (voir data_loader.refresh_market_panel).
+    """
+    panel, new_dates = refresh_market_panel(data_dir=data_dir)
+    if len(new_dates):
+        print(f"✅ {len(new_dates)} nouvelle(s) date(s) : {new_dates[0]:%Y-%m-%d} → {new_dates[-1]:%Y-%m-%d}")
+    else:
+        print("✅ Cache déjà à jour")
+    print(f"📦 Panel: {len(panel.dates)} dates x {len(panel.tickers)} tickers")
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2])
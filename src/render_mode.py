@@ -0,0 +1,15 @@
+# Modes de rendu des graphiques denses : "auto" (WebGL au-delà du seuil), "svg" ou "webgl"
+RENDER_MODES = ('auto', 'svg', 'webgl')
+
+# Nombre de points à partir duquel le mode "auto" passe en WebGL
+# (même seuil que plotly express en render_mode="auto")
+WEBGL_MIN_POINTS = 1000
+
+
+def use_webgl(n_points, render_mode='auto', min_points=WEBGL_MIN_POINTS):
+    """Vrai si un graphique de n_points doit être tracé en WebGL (Scattergl, Scatterpolargl)."""
+    if render_mode not in RENDER_MODES:
+        raise ValueError(f"Mode de rendu inconnu : {render_mode} (attendu : {', '.join(RENDER_MODES)})")
+    if render_mode == 'auto':
+        return n_points > min_points
+    return render_mode == 'webgl'
@@ -0,0 +1,310 @@
+import pandas as pd
+import numpy as np
+import hashlib
+import json
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou inter-processus
+    fcntl = None
+
+
+def rolling_sums(values, window):
+    """
+    Sommes glissantes (count, somme, somme des carrés) sur window lignes,
+    pour toutes les colonnes à la fois, en O(1) par ligne.
+
+    Les lignes sont découpées en blocs de window lignes : toute fenêtre est
+    la fin d'un bloc plus le début du bloc suivant. Avec un cumul par bloc
+    vers l'avant et vers l'arrière, chaque somme ne contient que les valeurs
+    de la fenêtre (pas de soustraction de grands cumuls, donc pas de perte de
+    précision après une valeur aberrante). Les valeurs non finies (NaN, ±inf)
+    sont ignorées, comme dans pandas.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[:, None]
+    n_rows, n_cols = values.shape
+
+    valid = np.isfinite(values)
+    stacked = np.stack([
+        valid.astype(np.float64),
+        np.where(valid, values, 0.0),
+        np.where(valid, values * values, 0.0)
+    ])
+
+    # Compléter à un multiple de window pour travailler par blocs
+    n_blocks = -(-n_rows // window) if n_rows else 0
+    padded = np.zeros((3, n_blocks * window, n_cols))
+    padded[:, :n_rows] = stacked
+    blocks = padded.reshape(3, n_blocks, window, n_cols)
+
+    prefix = np.cumsum(blocks, axis=2).reshape(3, -1, n_cols)
+    suffix = np.cumsum(blocks[:, :, ::-1], axis=2)[:, :, ::-1].reshape(3, -1, n_cols)
+
+    rows = np.arange(n_rows)
+    sums = prefix[:, rows].copy()
+
+    # Partie de la fenêtre située dans le bloc précédent : [i - window + 1, début du bloc[
+    start = rows - window + 1
+    spans_previous = (start >= 0) & (rows % window != window - 1)
+    sums[:, spans_previous] += suffix[:, start[spans_previous]]
+
+    return sums[0], sums[1], sums[2]
+
+
+def rolling_std(values, window, min_periods=1, ddof=1):
+    """
+    Écart-type glissant de toutes les colonnes (équivalent vectorisé de
+    DataFrame.rolling(window, min_periods).std()).
+    """
+    count, total, total_sq = rolling_sums(values, window)
+    return _std_from_sums(count, total, total_sq, min_periods, ddof)
+
+
+def _std_from_sums(count, total, total_sq, min_periods=1, ddof=1):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        variance = (total_sq - total * mean) / (count - ddof)
+    variance = np.clip(variance, 0.0, None)
+    variance[(count < max(min_periods, ddof + 1)) | (count == 0)] = np.nan
+    return np.sqrt(variance)
+
+
+class RollingStats:
+    """
+    Statistiques glissantes en flux (count, moyenne, variance) pour plusieurs
+    séries à la fois : chaque nouvelle ligne coûte O(1) par série.
+
+    Les window dernières lignes sont gardées dans un tampon circulaire ; les
+    sommes courantes sont mises à jour à chaque push et recalculées depuis le
+    tampon toutes les window lignes pour éviter la dérive numérique.
+    """
+
+    def __init__(self, n_series, window, min_periods=1, ddof=1):
+        self.window = window
+        self.min_periods = min_periods
+        self.ddof = ddof
+        self._buffer = np.full((window, n_series), np.nan)
+        self._pos = 0
+        self._count = np.zeros(n_series)
+        self._total = np.zeros(n_series)
+        self._total_sq = np.zeros(n_series)
+
+    @classmethod
+    def from_history(cls, history, window, min_periods=1, ddof=1):
+        """Initialise l'état avec les dernières lignes d'un historique (lignes x séries)."""
+        history = np.asarray(history, dtype=np.float64)
+        if history.ndim == 1:
+            history = history[:, None]
+        stats = cls(history.shape[1], window, min_periods, ddof)
+        for row in history[-window:]:
+            stats.push(row)
+        return stats
+
+    def push(self, row):
+        """Ajoute une ligne (une valeur par série) et retourne l'écart-type courant."""
+        row = np.asarray(row, dtype=np.float64)
+        evicted = self._buffer[self._pos]
+
+        old_valid = np.isfinite(evicted)
+        self._count -= old_valid
+        self._total -= np.where(old_valid, evicted, 0.0)
+        self._total_sq -= np.where(old_valid, evicted * evicted, 0.0)
+
+        new_valid = np.isfinite(row)
+        self._count += new_valid
+        self._total += np.where(new_valid, row, 0.0)
+        self._total_sq += np.where(new_valid, row * row, 0.0)
+
+        self._buffer[self._pos] = row
+        self._pos = (self._pos + 1) % self.window
+        if self._pos == 0:
+            self._resync()
+
+        return self.std()
+
+    def extend(self, rows):
+        """Ajoute plusieurs lignes ; retourne l'écart-type après chacune (lignes x séries)."""
+        return np.array([self.push(row) for row in np.asarray(rows, dtype=np.float64)])
+
+    def mean(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self._count > 0, self._total / self._count, np.nan)
+
+    def std(self):
+        return _std_from_sums(self._count.copy(), self._total, self._total_sq, self.min_periods, self.ddof)
+
+    def _resync(self):
+        """Recalcule les sommes exactes depuis le tampon."""
+        valid = np.isfinite(self._buffer)
+        values = np.where(valid, self._buffer, 0.0)
+        self._count = valid.sum(axis=0).astype(np.float64)
+        self._total = values.sum(axis=0)
+        self._total_sq = (values * values).sum(axis=0)
+
+
+class VolatilityCube:
+    """
+    Volatilités glissantes précalculées pour un ensemble de fenêtres :
+    cube (fenêtre x date x ticker). Une valeur de slider devient une simple
+    tranche du cube au lieu d'un recalcul sur tout l'historique.
+    """
+
+    def __init__(self, returns, windows, dtype=np.float64, path=None, key=None):
+        """
+        returns : DataFrame des rendements (dates x tickers)
+        windows : fenêtres à précalculer (ex: range(3, 30))
+        dtype : np.float64 ou np.float32 (moitié moins de mémoire)
+        path : fichier .npy pour garder le cube sur disque (mappé en mémoire),
+               partageable entre processus
+        key : version des données (ex: get_data_version()) ; un cube déjà
+              présent dans path est réutilisé si sa clé correspond
+        """
+        self.windows = list(windows)
+        self.index = returns.index
+        self.columns = returns.columns
+        self._window_pos = {window: i for i, window in enumerate(self.windows)}
+
+        shape = (len(self.windows), len(self.index), len(self.columns))
+        data = returns.to_numpy(dtype=np.float64)
+        if path is None:
+            cube = np.empty(shape, dtype=dtype)
+            self._fill(cube, data)
+            self.values = cube
+        else:
+            self.values = self._shared_cube(data, shape, np.dtype(dtype), str(path), key)
+
+    def _fill(self, cube, data):
+        for i, window in enumerate(self.windows):
+            cube[i] = rolling_std(data, window)
+
+    def _fill_tail(self, cube, data, start):
+        """
+        Complète les lignes start.. du cube, les lignes précédentes étant déjà
+        calculées : l'état de chaque fenêtre glissante est repris des window-1
+        rendements précédents (RollingStats), sans relire l'historique.
+        """
+        for i, window in enumerate(self.windows):
+            stats = RollingStats.from_history(data[max(start - (window - 1), 0):start], window)
+            cube[i, start:] = stats.extend(data[start:])
+
+    def _shared_cube(self, data, shape, dtype, path, key):
+        """
+        Cube mappé depuis path : réutilisé si sa clé (version des données,
+        fenêtres, dtype, dates, tickers) correspond, sinon construit dans un
+        fichier temporaire puis publié par os.replace, sous un verrou, comme
+        shared_data.load_shared_dataset. Un autre processus ne voit donc
+        jamais un cube partiel ou en cours de réécriture.
+
+        Après l'ajout de nouvelles dates (refresh_data.py), le cube publié
+        pour les dates précédentes est recopié et seules les nouvelles lignes
+        sont calculées (voir _fill_tail).
+        """
+        meta = {
+            "key": key,
+            "windows": self.windows,
+            "dtype": dtype.str,
+            "shape": list(shape),
+            "columns": [str(column) for column in self.columns],
+            "dates": [str(self.index[0]), str(self.index[-1])] if len(self.index) else [],
+            "digest": _returns_digest(data),
+        }
+        cube = _attach_cube(path, meta)
+        if cube is not None:
+            return cube
+
+        with open(f"{path}.lock", "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                # Un autre processus a pu publier le cube pendant l'attente du verrou
+                cube = _attach_cube(path, meta)
+                if cube is None:
+                    tmp = f"{path}.{os.getpid()}.tmp"
+                    building = np.lib.format.open_memmap(tmp, mode='w+', dtype=dtype, shape=shape)
+                    n_known = self._published_rows(path, meta, data)
+                    if n_known:
+                        building[:, :n_known] = np.load(path, mmap_mode='r')[:, :n_known]
+                        self._fill_tail(building, data, n_known)
+                    else:
+                        self._fill(building, data)
+                    building.flush()
+                    del building
+                    os.replace(tmp, path)
+
+                    meta_tmp = f"{path}.json.{os.getpid()}.tmp"
+                    with open(meta_tmp, "w") as f:
+                        json.dump(meta, f)
+                    os.replace(meta_tmp, f"{path}.json")
+                    cube = _attach_cube(path, meta)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return cube
+
+    def _published_rows(self, path, meta, data):
+        """
+        Nombre de lignes du cube déjà publié dans path qui restent valables :
+        mêmes fenêtres, dtype et tickers, et rendements identiques sur ses
+        dates (qui doivent être les premières de l'index actuel). 0 sinon.
+        """
+        try:
+            with open(f"{path}.json", "r") as f:
+                published = json.load(f)
+            n_rows = published["shape"][1]
+            if (any(published[name] != meta[name] for name in ("windows", "dtype", "columns"))
+                    or not 0 < n_rows <= len(self.index)
+                    or published["dates"] != [str(self.index[0]), str(self.index[n_rows - 1])]
+                    or published["digest"] != _returns_digest(data[:n_rows])):
+                return 0
+            if np.load(path, mmap_mode='r').shape != (len(self.windows), n_rows, len(self.columns)):
+                return 0
+        except (OSError, ValueError, KeyError):
+            return 0
+        return n_rows
+
+    @staticmethod
+    def estimate_nbytes(n_windows, n_dates, n_tickers, dtype=np.float64):
+        """Taille du cube en octets, avant de le construire."""
+        return n_windows * n_dates * n_tickers * np.dtype(dtype).itemsize
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes
+
+    def __contains__(self, window):
+        return window in self._window_pos
+
+    def get(self, window):
+        """Tableau (dates x tickers) des volatilités pour une fenêtre, sans copie."""
+        return self.values[self._window_pos[window]]
+
+    def frame(self, window):
+        """DataFrame (dates x tickers) des volatilités pour une fenêtre, sans copie."""
+        return pd.DataFrame(self.get(window), index=self.index, columns=self.columns, copy=False)
+
+    def covers(self, df, window, tickers):
+        """Vrai si le cube répond pour ce DataFrame (même index), cette fenêtre et ces tickers."""
+        return (window in self._window_pos
+                and len(df.index) == len(self.index) and df.index.equals(self.index)
+                and list(tickers) == self.columns.tolist())
+
+
+def _returns_digest(data):
+    """Empreinte des rendements (lignes x tickers) à partir desquels un cube a été calculé."""
+    return hashlib.md5(np.ascontiguousarray(data, dtype=np.float64).tobytes()).hexdigest()
+
+def _attach_cube(path, meta):
+    """Cube publié dans path (lecture seule), ou None s'il manque ou si sa clé ne correspond pas."""
+    try:
+        with open(f"{path}.json", "r") as f:
+            if json.load(f) != meta:
+                return None
+        cube = np.load(path, mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+    if cube.shape != tuple(meta["shape"]) or cube.dtype.str != meta["dtype"]:
+        return None
+    return cube
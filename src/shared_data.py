@@ -0,0 +1,170 @@
+import pandas as pd
+import numpy as np
+from pathlib import Path
+import json
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou inter-processus
+    fcntl = None
+
+
+def load_shared_dataset(path, build_dataset, data_version=None):
+    """
+    Retourne le DataFrame numérique de l'application adossé à un fichier
+    mappé en mémoire, partagé entre tous les workers (gunicorn) d'une machine.
+
+    Le premier processus qui obtient le verrou construit le DataFrame avec
+    build_dataset() et le publie ; les autres attendent puis s'attachent au
+    même fichier. Chaque worker obtient une vue en lecture seule, sans copie :
+    les pages sont partagées via le cache du système.
+
+    Parameters:
+    -----------
+    path : préfixe des fichiers publiés (ex: /dev/shm/market_data)
+    build_dataset : fonction sans argument retournant le DataFrame à publier
+    data_version : version des données sources ; une version différente de
+                   celle publiée déclenche une nouvelle publication
+    """
+    return _attach_or_publish(
+        path,
+        lambda: attach_dataset(path, data_version),
+        lambda: publish_dataset(build_dataset(), path, data_version)
+    )
+
+
+def load_shared_arrays(path, build_arrays, data_version=None):
+    """
+    Tableaux numpy dérivés des données (tenseur des événements, sommes
+    préfixes...) publiés une seule fois et partagés entre les workers, comme
+    load_shared_dataset : chaque worker obtient des vues mappées en lecture
+    seule, sans copie.
+
+    Parameters:
+    -----------
+    path : préfixe des fichiers publiés (ex: /dev/shm/market_data.aggregates)
+    build_arrays : fonction sans argument retournant un dict nom -> tableau
+    data_version : version des données sources (voir load_shared_dataset)
+    """
+    return _attach_or_publish(
+        path,
+        lambda: attach_arrays(path, data_version),
+        lambda: publish_arrays(build_arrays(), path, data_version)
+    )
+
+
+def _attach_or_publish(path, attach, publish):
+    """
+    S'attache à une publication existante ; sinon le premier processus qui
+    obtient le verrou publie, et les autres s'attachent après l'attente.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    published = attach()
+    if published is not None:
+        return published
+
+    with open(f"{path}.lock", "w") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            # Un autre worker a pu publier pendant l'attente du verrou
+            published = attach()
+            if published is None:
+                publish()
+                published = attach()
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    return published
+
+
+def publish_dataset(df, path, data_version=None):
+    """
+    Écrit les valeurs numériques de df (float64) dans path.npy, rangées
+    colonne par colonne, et les métadonnées (dates, colonnes) dans path.json.
+    Écritures atomiques : un lecteur ne voit jamais un fichier partiel.
+    """
+    path = Path(path)
+    suffix = f".{os.getpid()}.tmp"
+
+    values_tmp = Path(f"{path}.npy{suffix}")
+    with open(values_tmp, "wb") as f:
+        # (colonnes x dates) : chaque colonne est contiguë, comme dans un bloc pandas
+        np.save(f, np.ascontiguousarray(df.to_numpy(dtype=np.float64).T))
+    os.replace(values_tmp, f"{path}.npy")
+
+    meta_tmp = Path(f"{path}.json{suffix}")
+    with open(meta_tmp, "w") as f:
+        json.dump({
+            "data_version": data_version,
+            "columns": df.columns.tolist(),
+            "index_name": df.index.name,
+            "dates": df.index.strftime("%Y-%m-%d %H:%M:%S").tolist()
+        }, f)
+    os.replace(meta_tmp, f"{path}.json")
+
+
+def attach_dataset(path, data_version=None):
+    """
+    S'attache au DataFrame publié dans path (vue en lecture seule, sans copie).
+    Retourne None s'il n'existe pas ou si sa version ne correspond pas.
+    """
+    try:
+        with open(f"{path}.json", "r") as f:
+            meta = json.load(f)
+        if data_version is not None and meta.get("data_version") != data_version:
+            return None
+        values = np.load(f"{path}.npy", mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+
+    if values.shape != (len(meta["columns"]), len(meta["dates"])):
+        return None
+
+    index = pd.DatetimeIndex(pd.to_datetime(meta["dates"]), name=meta["index_name"])
+    return pd.DataFrame(values.T, index=index, columns=meta["columns"], copy=False)
+
+
+def publish_arrays(arrays, path, data_version=None):
+    """
+    Écrit chaque tableau de arrays (dict nom -> tableau) dans path.<nom>.npy
+    et la liste des tableaux dans path.json. Écritures atomiques, le fichier
+    json en dernier : un lecteur ne voit jamais une publication partielle.
+    """
+    suffix = f".{os.getpid()}.tmp"
+    meta = {"data_version": data_version, "arrays": {}}
+    for name, values in arrays.items():
+        values = np.asarray(values)
+        tmp = Path(f"{path}.{name}.npy{suffix}")
+        with open(tmp, "wb") as f:
+            np.save(f, values)
+        os.replace(tmp, f"{path}.{name}.npy")
+        meta["arrays"][name] = list(values.shape)
+
+    meta_tmp = Path(f"{path}.json{suffix}")
+    with open(meta_tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(meta_tmp, f"{path}.json")
+
+
+def attach_arrays(path, data_version=None):
+    """
+    Tableaux publiés dans path (dict nom -> vue en lecture seule, sans copie).
+    Retourne None s'ils n'existent pas ou si leur version ne correspond pas.
+    """
+    try:
+        with open(f"{path}.json", "r") as f:
+            meta = json.load(f)
+        if data_version is not None and meta.get("data_version") != data_version:
+            return None
+        arrays = {name: np.load(f"{path}.{name}.npy", mmap_mode="r") for name in meta["arrays"]}
+    except (OSError, ValueError, KeyError):
+        return None
+
+    if any(list(arrays[name].shape) != shape for name, shape in meta["arrays"].items()):
+        return None
+    return arrays
@@ -0,0 +1,232 @@
+import pandas as pd
+import numpy as np
+from pathlib import Path
+import glob
+import os
+import sqlite3
+import threading
+
+from data_loader import load_market_files, get_data_version
+from data_processor import compute_daily_returns, compute_volatility
+from lazy_dataset import LAZY_PADDING_DAYS
+from market_panel import PANEL_FIELDS
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou inter-processus
+    fcntl = None
+
+# Colonnes SQL correspondant aux champs du panel
+SQL_FIELDS = {field: field.lower().replace(' ', '_') for field in PANEL_FIELDS}
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def open_sql_store(db_path="data/market.sqlite", data_dir="data", pattern="*_Glob*l_Markets_Data.csv", engine="auto"):
+    """
+    Ouvre la base locale des données de marché, en l'alimentant depuis les
+    CSV lors du premier appel ou quand les CSV ont changé.
+
+    Plusieurs processus (workers gunicorn) peuvent l'ouvrir en même temps :
+    le premier qui obtient le verrou alimente la base, les autres attendent
+    puis relisent sa version, comme shared_data.load_shared_dataset.
+
+    engine : "sqlite", "duckdb" ou "auto" (DuckDB s'il est installé, sinon SQLite)
+    """
+    if engine == "auto":
+        engine = "duckdb" if duckdb is not None else "sqlite"
+
+    store = SqlMarketStore(db_path, engine)
+    data_version = get_data_version(data_dir, pattern)
+    if store.data_version == data_version:
+        return store
+
+    csv_files = glob.glob(str(Path(data_dir) / pattern))
+    if not csv_files:
+        raise FileNotFoundError(f"Aucun fichier trouvé avec le pattern {pattern} dans {data_dir}")
+
+    with open(f"{store.db_path}.lock", "w") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            # Un autre processus a pu alimenter la base pendant l'attente du verrou
+            store.reconnect()
+            if store.data_version != data_version:
+                store.ingest(csv_files, data_version)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    return store
+
+
+class SqlMarketStore:
+    """
+    Données de marché dans une base embarquée (SQLite ou DuckDB), indexée
+    sur (ticker, date) et sur date. Les requêtes ne lisent que les fenêtres
+    demandées, sans charger tout l'historique en mémoire.
+
+    La connexion est partagée par les threads du serveur : chaque requête
+    passe par un verrou (une connexion SQLite ou DuckDB n'accepte pas
+    d'accès concurrents).
+    """
+
+    def __init__(self, db_path, engine="sqlite"):
+        self.db_path = str(db_path)
+        self.engine = engine
+        if engine == "duckdb" and duckdb is None:
+            raise ImportError("duckdb n'est pas installé")
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._con = self._connect()
+
+    def _connect(self):
+        if self.engine == "duckdb":
+            con = duckdb.connect(self.db_path)
+        else:
+            # Les callbacks Dash peuvent être servis par plusieurs threads (accès sérialisés par _lock)
+            con = sqlite3.connect(self.db_path, check_same_thread=False)
+        con.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        return con
+
+    def reconnect(self):
+        """Rouvre la connexion (après le remplacement du fichier de la base par un autre processus)."""
+        with self._lock:
+            self._con.close()
+            self._con = self._connect()
+
+    def close(self):
+        with self._lock:
+            self._con.close()
+
+    @property
+    def data_version(self):
+        rows = self._execute("SELECT value FROM meta WHERE key = 'data_version'")
+        return rows[0][0] if rows else None
+
+    @property
+    def tickers(self):
+        return [row[0] for row in self._execute("SELECT DISTINCT ticker FROM market ORDER BY ticker")]
+
+    def ingest(self, csv_files, data_version=None):
+        """
+        (Re)crée la base à partir des CSV, fichier par fichier. La base est
+        construite dans un fichier temporaire puis publiée par os.replace :
+        les lecteurs (threads ou autres processus) ne voient jamais une table
+        market supprimée ou à moitié remplie.
+        """
+        tmp_path = f"{self.db_path}.{os.getpid()}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        builder = SqlMarketStore(tmp_path, self.engine)
+        try:
+            builder._load(csv_files, data_version)
+        finally:
+            builder.close()
+
+        with self._lock:
+            self._con.close()
+            os.replace(tmp_path, self.db_path)
+            self._con = self._connect()
+
+    def _load(self, csv_files, data_version):
+        """Crée et remplit la table market (base vide, non partagée)."""
+        columns = ", ".join(f"{name} DOUBLE" for name in SQL_FIELDS.values())
+        self._execute(f"CREATE TABLE market (ticker TEXT NOT NULL, date TEXT NOT NULL, {columns})")
+
+        placeholders = ", ".join(["?"] * (len(SQL_FIELDS) + 2))
+        for file in sorted(csv_files):
+            rows = _panel_to_frame(load_market_files([file]))
+            if rows.empty:
+                continue
+            if self.engine == "duckdb":
+                # Insertion en bloc : DuckDB lit le DataFrame colonne par colonne
+                self._con.register("new_rows", rows)
+                self._execute("INSERT INTO market SELECT * FROM new_rows")
+                self._con.unregister("new_rows")
+            else:
+                self._con.executemany(f"INSERT INTO market VALUES ({placeholders})", rows.itertuples(index=False, name=None))
+
+        # Index créés après le chargement (plus rapide que pendant les insertions)
+        self._execute("CREATE INDEX idx_market_ticker_date ON market (ticker, date)")
+        self._execute("CREATE INDEX idx_market_date ON market (date)")
+
+        self._execute("INSERT INTO meta VALUES ('data_version', ?)", (data_version,))
+        self._con.commit()
+
+    def query(self, start, end, field='Volume', tickers=None):
+        """DataFrame (dates x tickers) d'un champ entre start et end (inclus)."""
+        return self._query_ranges([(pd.Timestamp(start), pd.Timestamp(end))], field, tickers)
+
+    def history(self, ticker, field='Volume'):
+        """Historique complet d'un seul ticker (vue polaire)."""
+        sql = f"SELECT date, ticker, {SQL_FIELDS[field]} FROM market WHERE ticker = ? ORDER BY date"
+        return _pivot_rows(self._execute(sql, (ticker,)))
+
+    def frame_for(self, dates, pad_days=0):
+        """
+        DataFrame traité (volumes, _return, _volatility) couvrant les dates
+        ± pad_days (plus LAZY_PADDING_DAYS pour les calculs glissants).
+        """
+        if len(dates) == 0:
+            return pd.DataFrame()
+
+        pad = pd.Timedelta(days=pad_days + LAZY_PADDING_DAYS)
+        ranges = sorted((pd.Timestamp(d) - pad, pd.Timestamp(d) + pad) for d in dates)
+
+        # Fusionner les plages qui se chevauchent
+        merged = [ranges[0]]
+        for start, end in ranges[1:]:
+            if start <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+            else:
+                merged.append((start, end))
+
+        volumes = self._query_ranges(merged, 'Volume')
+        if volumes.empty:
+            return volumes
+        return compute_volatility(compute_daily_returns(volumes))
+
+    def _query_ranges(self, ranges, field, tickers=None):
+        conditions = " OR ".join(["date BETWEEN ? AND ?"] * len(ranges))
+        params = [value.strftime(DATE_FORMAT) for rng in ranges for value in rng]
+        sql = f"SELECT date, ticker, {SQL_FIELDS[field]} FROM market WHERE ({conditions})"
+        if tickers:
+            sql += f" AND ticker IN ({', '.join(['?'] * len(tickers))})"
+            params += list(tickers)
+        return _pivot_rows(self._execute(sql, params))
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._con.execute(sql, params).fetchall()
+
+
+def _panel_to_frame(panel):
+    """
+    DataFrame [ticker, date, champs...] d'un panel, dans l'ordre des colonnes
+    de la table market, sans les (date, ticker) sans volume. Construit par
+    indexation vectorisée ; les NaN sont enregistrés comme NULL.
+    """
+    date_idx, ticker_idx = np.nonzero(~np.isnan(panel.field_values('Volume')))
+    columns = {
+        'ticker': panel.tickers.to_numpy(dtype=object)[ticker_idx],
+        'date': panel.dates.strftime(DATE_FORMAT).to_numpy(dtype=object)[date_idx],
+    }
+    for field, name in SQL_FIELDS.items():
+        columns[name] = panel.field_values(field)[date_idx, ticker_idx].astype(np.float64)
+    return pd.DataFrame(columns)
+
+
+def _pivot_rows(rows):
+    """Résultat SQL (date, ticker, valeur) -> DataFrame dates x tickers."""
+    if not rows:
+        return pd.DataFrame()
+    long_df = pd.DataFrame(rows, columns=['Date', 'Ticker', 'Value'])
+    long_df['Date'] = pd.to_datetime(long_df['Date'])
+    wide = long_df.pivot_table(index='Date', columns='Ticker', values='Value', aggfunc='first')
+    return wide.sort_index()
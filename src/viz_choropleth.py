@@ -1,15 +1,30 @@
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-import pycountry
-import pycountry_convert as pc
 import numpy as np
+import json
+from functools import lru_cache
+from pathlib import Path
 
-def build_choropleth(df, events, event_name, region_map, post_window=5, range_color=[-100, 100]):
+from group_matrix import group_matrix_of, ticker_stats
+
+# Table ISO-3 -> code continent, générée une fois depuis pycountry (voir write_country_continents)
+COUNTRY_CONTINENTS_PATH = Path(__file__).parent / "config" / "country_continents.json"
+
+# Régions de la carte -> codes continents
+REGION_CONTINENTS = {
+    'Americas': ['NA', 'SA'],  # Amérique du Nord + Sud
+    'Europe': ['EU'],
+    'Asia': ['AS', 'OC']       # Asie + Océanie (pour inclure Australie)
+}
+
+def build_choropleth(df, events, event_name, region_map, post_window=5, range_color=[-100, 100], aggregates=None):
     """
     Construit une carte choroplèthe montrant l'impact des événements géopolitiques 
     sur les rendements boursiers par région.
     Utilise la logique adaptée du code de travail fourni.
+    aggregates : PrefixAggregates construits sur df (optionnel), pour toute date d'événement ;
+    le calcul sur df (_frame_regions) reste la référence
     """
     
     # === 1) TROUVER L'ÉVÉNEMENT SÉLECTIONNÉ ===
@@ -24,100 +39,32 @@ def build_choropleth(df, events, event_name, region_map, post_window=5, range_co
     
     event_date = pd.to_datetime(selected_event['date'])
     
-    # === 2) PRÉPARER LES DONNÉES AVEC RENDEMENTS ===
-    # Convertir le df pivot en format long pour les calculs de rendements
-    df_long = df.reset_index().melt(
-        id_vars=['Date'], 
-        var_name='Ticker', 
-        value_name='Close'
-    ).dropna()
-    
-    # Trier et calculer les rendements journaliers
-    df_long = df_long.sort_values(['Ticker', 'Date'])
-    df_long['ret'] = df_long.groupby('Ticker')['Close'].pct_change()
-    
-    # === 3) DÉFINIR LA FENÊTRE AUTOUR DE L'ÉVÉNEMENT ===
-    window = max(post_window, 5)  # Au moins 5 jours pour avoir des données
-    mask = (
-        (df_long['Date'] >= event_date - pd.Timedelta(days=window)) &
-        (df_long['Date'] <= event_date + pd.Timedelta(days=window))
-    )
-    df_win = df_long.loc[mask].copy()
-    
-    if len(df_win) == 0:
-        return _create_empty_choropleth(f"Pas de données pour la période autour du {event_date.strftime('%Y-%m-%d')}")
-    
-    # === 4) CALCUL DES RENDEMENTS MOYENS POST-ÉVÉNEMENT PAR RÉGION ===
-    regions = []
-    for region, tickers in region_map.items():
-        # Filtrer les données pour cette région et période post-événement
-        sub = df_win[
-            df_win['Ticker'].isin(tickers) & 
-            (df_win['Date'] > event_date) & 
-            (df_win['Date'] <= event_date + pd.Timedelta(days=post_window))
-        ]
-        
-        if len(sub) > 0:
-            mean_ret = sub['ret'].mean() * 100  # Convertir en pourcentage
-            num_indices = len(sub['Ticker'].unique())
-            indices_list = ', '.join(sorted(sub['Ticker'].unique()))
-        else:
-            mean_ret = 0
-            num_indices = 0
-            indices_list = "Aucun indice disponible"
-        
-        regions.append({
-            'region': region, 
-            'mean_return': mean_ret,
-            'num_indices': num_indices,
-            'indices': indices_list
-        })
+    if aggregates is not None and aggregates.covers(df, 'change', df.columns):
+        # Sommes préfixes : moyennes en temps constant, quelle que soit la date
+        regions = _aggregate_regions(aggregates, event_date, region_map, post_window)
+        if regions is None:
+            return _create_empty_choropleth(f"Pas de données pour la période autour du {event_date.strftime('%Y-%m-%d')}")
+    else:
+        # === 2) RENDEMENTS DE LA FENÊTRE POST-ÉVÉNEMENT, PAR TICKER ===
+        regions = _frame_regions(df, event_date, region_map, post_window)
+        if regions is None:
+            return _create_empty_choropleth(f"Pas de données pour la période autour du {event_date.strftime('%Y-%m-%d')}")
     
     region_df = pd.DataFrame(regions)
     
     if len(region_df) == 0:
         return _create_empty_choropleth("Aucune donnée de rendement calculée")
     
-    # === 5) CONSTRUIRE LA CARTE ISO DYNAMIQUE ===
-    continent_codes_map = {
-        'Americas': ['NA', 'SA'],  # Amérique du Nord + Sud
-        'Europe': ['EU'],
-        'Asia': ['AS', 'OC']       # Asie + Océanie (pour inclure Australie)
-    }
-    
-    iso_map = {}
-    for region, cont_codes in continent_codes_map.items():
-        isos = []
-        for country in pycountry.countries:
-            try:
-                cc2 = country.alpha_2
-                cont = pc.country_alpha2_to_continent_code(cc2)
-                if cont in cont_codes:
-                    isos.append(country.alpha_3)
-            except Exception:
-                continue
-        iso_map[region] = isos
+    # === 5) EXPLOSER REGION_DF POUR AVOIR UN ENREGISTREMENT PAR PAYS ISO ===
+    # Jointure avec la table précalculée région -> pays ISO
+    map_df = region_df.merge(_region_countries(), on='region', how='inner')
     
-    # === 6) EXPLOSER REGION_DF POUR AVOIR UN ENREGISTREMENT PAR PAYS ISO ===
-    rows = []
-    for _, row in region_df.iterrows():
-        region_name = row['region']
-        if region_name in iso_map:
-            for iso in iso_map[region_name]:
-                rows.append({
-                    'iso_alpha': iso,
-                    'region': region_name,
-                    'mean_return': row['mean_return'],
-                    'num_indices': row['num_indices'],
-                    'indices': row['indices']
-                })
-    
-    if not rows:
+    if len(map_df) == 0:
         return _create_empty_choropleth("Erreur dans le mapping des pays")
     
-    map_df = pd.DataFrame(rows)
+    map_df = map_df[['iso_alpha', 'region', 'mean_return', 'num_indices', 'indices']]
     
-    # === 7) CRÉER LA CARTE CHOROPLÈTHE AVEC ÉCHELLE PERSONNALISÉE ===
+    # === 6) CRÉER LA CARTE CHOROPLÈTHE AVEC ÉCHELLE PERSONNALISÉE ===
     # Zone neutre : -1% à +1% en jaune
     custom_colorscale = [
         [0.0, '#800000'],   # -100% : 
@@ -146,7 +93,7 @@ def build_choropleth(df, events, event_name, region_map, post_window=5, range_co
         title=f"Impact de '{event_name}' sur les marchés mondiaux<br><sub>Rendement moyen {post_window} jours après le {event_date.strftime('%d/%m/%Y')}</sub>"
     )
     
-    # === 8) PERSONNALISER LE HOVER ===
+    # === 7) PERSONNALISER LE HOVER ===
     fig.update_traces(
         hovertemplate=(
             "<b>%{hovertext}</b><br>" +
@@ -159,7 +106,7 @@ def build_choropleth(df, events, event_name, region_map, post_window=5, range_co
         customdata=map_df[['indices', 'num_indices']].values
     )
     
-    # === 9) MISE À JOUR DU LAYOUT ===
+    # === 8) MISE À JOUR DU LAYOUT ===
     fig.update_layout(
         geo=dict(
             showframe=False, 
@@ -190,6 +137,134 @@ def build_choropleth(df, events, event_name, region_map, post_window=5, range_co
     return fig
 
 
+def _frame_regions(df, event_date, region_map, post_window):
+    """
+    Rendement moyen post-événement par région, calculé sur le DataFrame
+    pivot (None si aucune donnée autour de l'événement). Seules les lignes
+    de la fenêtre sont lues, plus celles qui remontent jusqu'à la dernière
+    cotation de chaque ticker avant la fenêtre : le rendement d'une cotation
+    se calcule par rapport à la cotation précédente du même ticker.
+    """
+    window = pd.Timedelta(days=max(post_window, 5))  # Au moins 5 jours pour avoir des données
+    lo = df.index.searchsorted(event_date - window, side='left')
+    hi = df.index.searchsorted(event_date + window, side='right')
+    if not df.iloc[lo:hi].notna().to_numpy().any():
+        return None
+
+    # Lignes ]event_date, event_date + post_window]
+    start = df.index.searchsorted(event_date, side='right')
+    stop = max(df.index.searchsorted(event_date + pd.Timedelta(days=post_window), side='right'), start)
+
+    members = {ticker for tickers in region_map.values() for ticker in tickers}
+    tickers = [ticker for ticker in df.columns if ticker in members]
+    columns = [df.columns.get_loc(ticker) for ticker in tickers]
+    first = _last_quote_row(df, columns, start)
+    # Calcul en float64, comme les sommes préfixes, quel que soit le type des volumes reçus
+    closes = df.iloc[first:stop, columns].astype('float64')
+    values = closes.to_numpy()[start - first:]
+    # Dernière cotation connue avant chaque ligne
+    previous = closes.ffill().shift(1).to_numpy()[start - first:]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        returns = np.where(np.isnan(values), np.nan, values / previous - 1)
+
+    quoted = ~np.isnan(values).all(axis=0)
+    return _group_regions(group_matrix_of(region_map, tickers), quoted, ticker_stats(returns.T))
+
+def _last_quote_row(df, columns, start, block=8):
+    """
+    Première ligne à lire pour connaître la dernière cotation de chaque
+    colonne avant start : on remonte par blocs de taille croissante jusqu'à
+    ce que chaque colonne ait une valeur (ou jusqu'au début de l'historique).
+    """
+    first = start
+    while first > 0:
+        first = max(start - block, 0)
+        if df.iloc[first:start, columns].notna().to_numpy().any(axis=0).all():
+            break
+        block *= 2
+    return first
+
+def _aggregate_regions(aggregates, event_date, region_map, post_window):
+    """
+    Rendement moyen post-événement par région, calculé avec les sommes
+    préfixes (None si aucune donnée autour de l'événement).
+    """
+    window = pd.Timedelta(days=max(post_window, 5))  # Au moins 5 jours pour avoir des données
+    around = aggregates.rows(event_date - window, event_date + window)
+    if aggregates.count('volume', around).sum() == 0:
+        return None
+
+    # Jours ]event_date, event_date + post_window] (variation depuis la dernière cotation)
+    post = aggregates.rows(event_date, event_date + pd.Timedelta(days=post_window), include_start=False)
+
+    quoted = aggregates.count('volume', post) > 0
+    stats = aggregates.stats('change', post)
+    return _group_regions(group_matrix_of(region_map, aggregates.tickers), quoted, stats)
+
+def _group_regions(groups, quoted, stats):
+    """
+    Enregistrements par région à partir des statistiques par ticker : un
+    seul produit matriciel avec la matrice d'appartenance pour toutes les
+    régions. quoted indique les tickers cotés dans la fenêtre.
+    """
+    means = groups.pooled_means(stats) * 100  # Convertir en pourcentage
+    counts = groups.counts(quoted)
+    members = groups.members(quoted)
+
+    regions = []
+    for region, mean_ret, num_indices, quoted_members in zip(groups.names, means, counts, members):
+        if num_indices > 0:
+            indices_list = ', '.join(quoted_members)
+        else:
+            mean_ret = 0
+            indices_list = "Aucun indice disponible"
+
+        regions.append({
+            'region': region,
+            'mean_return': mean_ret,
+            'num_indices': int(num_indices),
+            'indices': indices_list
+        })
+    return regions
+
+def _compute_country_continents():
+    """Code continent de chaque pays (ISO-3), dans l'ordre de pycountry."""
+    import pycountry
+    import pycountry_convert as pc
+
+    table = {}
+    for country in pycountry.countries:
+        try:
+            table[country.alpha_3] = pc.country_alpha2_to_continent_code(country.alpha_2)
+        except Exception:
+            continue
+    return table
+
+def write_country_continents(path=COUNTRY_CONTINENTS_PATH):
+    """Régénère le fichier de la table pays -> continent (après une mise à jour de pycountry)."""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(_compute_country_continents(), f, indent=4)
+        f.write('\n')
+
+@lru_cache(maxsize=None)
+def _country_continents():
+    """Table pays -> continent : lue dans le fichier livré, recalculée avec pycountry s'il manque."""
+    try:
+        with open(COUNTRY_CONTINENTS_PATH, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return _compute_country_continents()
+
+@lru_cache(maxsize=None)
+def _region_countries():
+    """DataFrame (region, iso_alpha) : un enregistrement par pays de chaque région de la carte."""
+    continents = pd.Series(_country_continents(), name='continent').rename_axis('iso_alpha').reset_index()
+    frames = [
+        continents.loc[continents['continent'].isin(codes), ['iso_alpha']].assign(region=region)
+        for region, codes in REGION_CONTINENTS.items()
+    ]
+    return pd.concat(frames, ignore_index=True)[['region', 'iso_alpha']]
+
 def _create_empty_choropleth(message): 
     """Crée une carte vide avec un message d'erreur."""
     fig = go.Figure() 
@@ -3,7 +3,11 @@ import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 
-def build_compare_chart(df, events, selected_category="Geopolitique", window_days=0, mode="return"): 
+from rolling_stats import rolling_std
+from data_processor import schema_of
+from event_index import event_index_of
+
+def build_compare_chart(df, events, selected_category="Geopolitique", window_days=0, mode="return", cube=None, day_unit="calendar", aggregates=None): 
     """ Construit un diagramme à barres groupees comparant l'impact des evenements par categorie et type d'actif (indices boursiers vs matières premières).
     Parameters:
     -----------
@@ -12,6 +16,10 @@ def build_compare_chart(df, events, selected_category="Geopolitique", window_day
     selected_category : categorie d'evenement à analyser
     window_days : fenêtre temporelle (0 = jour J seulement)
     mode : "return" ou "volatility"
+    cube : VolatilityCube précalculé sur df (optionnel) pour le mode "volatility"
+    day_unit : "calendar" (±N jours calendaires) ou "trading" (±N jours de bourse)
+    aggregates : PrefixAggregates construits sur df (optionnel), pour toute date d'événement ;
+    le calcul sur df (_frame_means) reste la référence
     """
     # Classification des actifs
     commodities = ['CL=F', 'GC=F']  # Matières premières (petrole, or)
@@ -22,101 +30,43 @@ def build_compare_chart(df, events, selected_category="Geopolitique", window_day
     if not filtered_events:
         return _create_empty_compare(f"Aucun evenement trouve pour la categorie '{selected_category}'")
 
-    records = []
+    schema = schema_of(df)
+    event_index = event_index_of(df, events)
+    vol_tickers = [ticker for ticker in schema.tickers() if schema.has(ticker, 'return')]
+    tickers = vol_tickers if mode == "volatility" else schema.tickers('return')
+
+    # Moyenne de la métrique par (événement, ticker) pour tous les événements à la fois
+    names = [event["name"] for event in filtered_events]
+    means, counts = _event_means(df, schema, event_index, names, tickers, window_days, mode, cube, day_unit, aggregates)
 
-    for event in filtered_events:
+    # Valeurs en %, plafonnées à des valeurs raisonnables (la volatilité ne peut pas être négative)
+    values = np.clip(means * 100, -50, 50) if mode == "return" else np.clip(means * 100, 0, 20)
+    included = counts > 0
+
+    # Une réduction vectorisée par type d'actif
+    is_commodity = np.isin(tickers, commodities)
+    asset_classes = [("Indices boursiers", ~is_commodity), ("Matières premières", is_commodity)]
+    class_stats = []
+    for asset_type, columns in asset_classes:
+        selected = included & columns
+        n_assets = selected.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            averages = np.where(selected, values, 0.0).sum(axis=1) / n_assets
+        class_stats.append((asset_type, averages, n_assets))
+
+    records = []
+    for i, event in enumerate(filtered_events):
         event_date = pd.to_datetime(event["date"])
-        event_name = event["name"]
-        
-        # Definir la fenêtre d'analyse
-        if window_days == 0:
-            # Seulement le jour de l'evenement
-            analysis_dates = [event_date] if event_date in df.index else []
-        else:
-            # Fenêtre autour de l'evenement
-            start_date = event_date - pd.Timedelta(days=window_days)
-            end_date = event_date + pd.Timedelta(days=window_days)
-            analysis_dates = [d for d in pd.date_range(start_date, end_date) if d in df.index]
-        
-        if not analysis_dates:
-            continue
-        
-        # Recalculer la volatilité pour la fenêtre spécifiée
-        if mode == "volatility":
-            # Recalculer la volatilité sur la fenêtre d'analyse pour cet événement
-            volatility_window = max(3, len(analysis_dates))  # Fenêtre adaptative
-            df_temp = df.copy()
-            
-            # Recalculer la volatilité avec la nouvelle fenêtre
-            for col in df.columns:
-                if not col.endswith(('_return', '_volatility')):
-                    return_col = f"{col}_return"
-                    if return_col in df.columns:
-                        vol_series = df[return_col].rolling(window=volatility_window, min_periods=1).std()
-                        df_temp[f"{col}_volatility"] = vol_series
-            
-            df_working = df_temp
-            suffix = "_volatility"
-        else:
-            df_working = df
-            suffix = "_return"
-
-        
-        # Indices boursiers
-        indices_values = []
-        # Matières premières
-        commodities_values = []
-        
-        for col in df.columns:
-            if col.endswith(suffix):
-                ticker = col.replace(suffix, "")
-                
-                # Recuperer les valeurs pour les dates d'analyse
-                event_values = df_working.loc[analysis_dates, col].dropna()
-                
-                if len(event_values) > 0:
-                    avg_value = event_values.mean()
-                    
-                    if mode == "return":
-                        # Les colonnes _return sont TOUJOURS en décimal, convertir en %
-                        avg_value *= 100
-                        # Plafonner à des valeurs raisonnables
-                        avg_value = max(-50, min(50, avg_value))
-                    else:
-                        # Les colonnes _volatility sont en décimal, convertir en %
-                        avg_value *= 100
-                        # La volatilité ne peut pas être négative et on plafonne à 20%
-                        avg_value = max(0, min(20, avg_value))
-
-                    
-                    # Classer par type d'actif
-                    if ticker in commodities:
-                        commodities_values.append(avg_value)
-                    else:
-                        indices_values.append(avg_value)
-        
-        # Calculer les moyennes par type d'actif
-        if indices_values:
-            indices_avg = np.mean(indices_values)
-            records.append({
-                "evenement": event_name,
-                "Type d'actif": "Indices boursiers",
-                "Valeur": indices_avg,
-                "Date": event_date.strftime("%Y-%m-%d"),
-                "Categorie": selected_category,
-                "Nombre d'actifs": len(indices_values)
-            })
-        
-        if commodities_values:
-            commodities_avg = np.mean(commodities_values)
-            records.append({
-                "evenement": event_name,
-                "Type d'actif": "Matières premières",
-                "Valeur": commodities_avg,
-                "Date": event_date.strftime("%Y-%m-%d"),
-                "Categorie": selected_category,
-                "Nombre d'actifs": len(commodities_values)
-            })
+        for asset_type, averages, n_assets in class_stats:
+            if n_assets[i] > 0:
+                records.append({
+                    "evenement": event["name"],
+                    "Type d'actif": asset_type,
+                    "Valeur": averages[i],
+                    "Date": event_date.strftime("%Y-%m-%d"),
+                    "Categorie": selected_category,
+                    "Nombre d'actifs": int(n_assets[i])
+                })
 
     if not records:
         return _create_empty_compare(f"Aucune donnee disponible pour '{selected_category}'")
@@ -143,7 +93,7 @@ def build_compare_chart(df, events, selected_category="Geopolitique", window_day
     )
 
     # Titre dynamique
-    window_text = "Jour J" if window_days == 0 else f"±{window_days} jours"
+    window_text = "Jour J" if window_days == 0 else f"±{window_days} {'jours de bourse' if day_unit == 'trading' else 'jours'}"
     metric_text = "Rendements moyens" if mode == "return" else "Volatilite moyenne"
 
     fig.update_layout(
@@ -195,6 +145,69 @@ def build_compare_chart(df, events, selected_category="Geopolitique", window_day
 
     return fig
 
+def _event_means(df, schema, event_index, names, tickers, window_days, mode, cube, day_unit, aggregates):
+    """
+    Moyennes et nombres de valeurs (événements x tickers) de la métrique sur
+    la fenêtre d'analyse de chaque événement.
+
+    Les événements sont regroupés par métrique (en volatilité, la fenêtre
+    adaptative dépend du nombre de séances de la fenêtre d'analyse) ; chaque
+    groupe est calculé en une fois, depuis les sommes préfixes ou df.
+    """
+    # Fenêtres d'analyse (tranches contiguës de lignes, jour J seul si window_days == 0)
+    windows = [event_index.window(name, window_days, day_unit=day_unit) for name in names]
+    starts = np.array([rows.start for rows in windows], dtype=np.intp)
+    stops = np.array([rows.stop for rows in windows], dtype=np.intp)
+    n_rows = stops - starts
+
+    means = np.full((len(names), len(tickers)), np.nan)
+    counts = np.zeros((len(names), len(tickers)), dtype=np.int64)
+
+    groups = {}
+    for i in np.flatnonzero(n_rows > 0):
+        # Volatilité : fenêtre adaptative = nombre de séances de la fenêtre d'analyse
+        metric = 'return' if mode == "return" else ('volatility', max(3, int(n_rows[i])))
+        groups.setdefault(metric, []).append(i)
+
+    use_aggregates = aggregates is not None and aggregates.covers(df, 'return', tickers)
+    for metric, group in groups.items():
+        if use_aggregates and metric in aggregates.metrics:
+            means[group], counts[group] = aggregates.window_means(metric, starts[group], stops[group])
+        else:
+            means[group], counts[group] = _frame_means(df, schema, tickers, starts[group], stops[group], metric, cube)
+    return means, counts
+
+def _frame_means(df, schema, tickers, starts, stops, metric, cube):
+    """
+    Moyennes et nombres de valeurs (événements x tickers), calculés à partir
+    de df : toutes les fenêtres sont rassemblées en un seul tableau, puis
+    réduites par événement.
+    """
+    returns = df.iloc[:, [schema.position(ticker, 'return') for ticker in tickers]]
+    offset = 0
+    if metric == 'return':
+        layer = returns.to_numpy(dtype='float64')
+    elif cube is not None and cube.covers(df, metric[1], tickers):
+        layer = cube.get(metric[1])
+    else:
+        # Volatilité recalculée uniquement sur les lignes utiles (plus l'historique de la fenêtre glissante)
+        window = metric[1]
+        offset = max(int(starts.min()) - window + 1, 0)
+        history = returns.iloc[offset:int(stops.max())].to_numpy(dtype='float64')
+        layer = rolling_std(history, window)
+
+    # Positions de toutes les lignes des fenêtres, concaténées
+    lengths = stops - starts
+    bounds = np.cumsum(lengths) - lengths
+    rows = np.repeat(starts - offset - bounds, lengths) + np.arange(lengths.sum())
+    values = np.asarray(layer)[rows]
+
+    valid = ~np.isnan(values)
+    counts = np.add.reduceat(valid.astype(np.int64), bounds, axis=0)
+    sums = np.add.reduceat(np.where(valid, values, 0.0), bounds, axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / counts, counts
+
 def _create_empty_compare(message): 
     """Cree un graphique vide avec un message d'erreur."""
     fig = go.Figure() 
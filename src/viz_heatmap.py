@@ -3,6 +3,8 @@ import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 
+from data_processor import schema_of
+
 def _create_empty_heatmap(message): 
     """Crée une heatmap vide avec un message d'erreur."""
     fig = go.Figure() 
@@ -10,7 +12,7 @@ def _create_empty_heatmap(message):
     fig.update_layout( title="Heatmap - Données non disponibles", height=400, xaxis=dict(visible=False), yaxis=dict(visible=False), plot_bgcolor='white' ) 
     return fig
 
-def build_heatmap(df, events, selected_event, window_days=7): 
+def build_heatmap(df, events, selected_event, window_days=7, tensor=None): 
     """ Construit une heatmap montrant l'impact des événements géopolitiques sur les rendements boursiers autour de la date de l'événement.
     Parameters:
     -----------
@@ -18,6 +20,8 @@ def build_heatmap(df, events, selected_event, window_days=7):
     events : liste des événements avec name et date
     selected_event : nom de l'événement sélectionné
     window_days : nombre de jours de chaque côté de l'événement
+    tensor : EventTensor en jours calendaires construit sur df (optionnel) ;
+    le calcul sur df reste la référence
     """
 
     # Trouver l'événement sélectionné
@@ -33,11 +37,9 @@ def build_heatmap(df, events, selected_event, window_days=7):
     event_date = pd.to_datetime(event_info['date'])
 
     # === RÉCUPÉRER TOUS LES INDICES AVEC LEURS RENDEMENTS ===
-    # Trouver toutes les colonnes de rendements
-    return_columns = [col for col in df.columns if col.endswith('_return')]
-    
-    # Extraire les noms des indices 
-    available_indices = [col.replace('_return', '') for col in return_columns]
+    # Indices ayant une colonne de rendements (schéma construit une fois par DataFrame)
+    schema = schema_of(df)
+    available_indices = schema.tickers('return')
     
     
     if not available_indices:
@@ -45,77 +47,22 @@ def build_heatmap(df, events, selected_event, window_days=7):
 
 
     # Créer la plage de jours autour de l'événement
-    days_range = list(range(-window_days, window_days + 1))
-    date_range = [event_date + pd.Timedelta(days=i) for i in days_range]
-
-    # Convertir les données pour calculer les rendements
-    df_returns = df.copy()
-
-
-    # Construire les données pour la heatmap
-    # Construire les données pour la heatmap ( avec gestion weekends)
-    records = []
-    for ticker in available_indices:
-        return_col = f"{ticker}_return"
-        if return_col not in df_returns.columns:
-            continue
-            
-        for offset, date in zip(days_range, date_range):
-            # Vérifier si c'est un weekend
-            is_weekend = date.weekday() >= 5  # Samedi=5, Dimanche=6
-            
-            if date in df_returns.index:
-                ret = df_returns.loc[date, return_col]
-                if pd.notna(ret):
-                    # Convertir en pourcentage pour la cohérence
-                    ret_percent = ret * 100
-                    records.append({
-                        "Indice": ticker,
-                        "Jour": offset,
-                        "Rendement": ret_percent,  # valeur en %
-                        "Date": date.strftime("%Y-%m-%d"),
-                        "Text": f"{ret_percent:.1f}%"  # 
-                    })
-                else:
-                    records.append({
-                        "Indice": ticker,
-                        "Jour": offset,
-                        "Rendement": np.nan,
-                        "Date": date.strftime("%Y-%m-%d"),
-                        "Text": "N/A"
-                    })
-            else:
-                # Différencier weekends des vraies données manquantes
-                if is_weekend:
-
-                    records.append({
-                        "Indice": ticker,
-                        "Jour": offset,
-                        "Rendement": np.nan,
-                        "Date": date.strftime("%Y-%m-%d"),
-                        "Text": "📅"  # Icône weekend
-                    })
-                else:
-                    records.append({
-                        "Indice": ticker,
-                        "Jour": offset,
-                        "Rendement": np.nan,
-                        "Date": date.strftime("%Y-%m-%d"),
-                        "Text": "❌"  # Vraie donnée manquante
-                    })
-
-
-
-    if not records:
-        return _create_empty_heatmap("Aucune donnée de rendement disponible")
-
-    # Créer le DataFrame pour la heatmap
-    heatmap_df = pd.DataFrame(records)
-
-    # Pivoter les données pour la heatmap
-    z_matrix = heatmap_df.pivot(index="Indice", columns="Jour", values="Rendement")
-    text_matrix = heatmap_df.pivot(index="Indice", columns="Jour", values="Text")
-    date_matrix = heatmap_df.pivot(index="Indice", columns="Jour", values="Date")
+    days_range = np.arange(-window_days, window_days + 1)
+    date_range = pd.DatetimeIndex(event_date + pd.to_timedelta(days_range, unit='D'))
+
+    # Rendements (indices x jours) de la fenêtre
+    if tensor is not None and tensor.covers(df, selected_event, window_days, 'return', available_indices):
+        # Tranche du tenseur des événements : aucune lecture de l'historique
+        values = tensor.slice(selected_event, 'return', window_days)
+        present = tensor.window_present(selected_event, window_days)
+    else:
+        # Une seule réindexation de la fenêtre sur l'index (seules les lignes de la fenêtre sont lues)
+        rows = df.index.get_indexer(date_range)
+        present = rows >= 0
+        values = np.full((len(available_indices), len(date_range)), np.nan)
+        values[:, present] = df.iloc[rows[present], schema.positions('return')].to_numpy(dtype=np.float64).T
+
+    z_matrix, text_matrix, date_matrix = _heatmap_matrices(values, present, available_indices, date_range, days_range)
 
     # Créer la heatmap
     fig = go.Figure()
@@ -179,4 +126,27 @@ def build_heatmap(df, events, selected_event, window_days=7):
         ],
         
     )
-    return fig
\ No newline at end of file
+    return fig
+
+
+def _heatmap_matrices(values, present, tickers, date_range, days_range):
+    """
+    Matrices (rendements %, textes, dates) de la heatmap, indices triés.
+    values : rendements décimaux (indices x jours) ; present : jours présents dans l'index.
+    Texte : valeur en %, "N/A" si NaN, "📅" pour un week-end absent, "❌" pour un jour manquant.
+    """
+    order = np.argsort(np.array(tickers, dtype=object), kind='stable')
+    sorted_tickers = [tickers[i] for i in order]
+    values = values[order] * 100
+
+    weekend = date_range.dayofweek >= 5  # Samedi=5, Dimanche=6
+    missing_text = np.where(present, "N/A", np.where(weekend, "📅", "❌"))
+    missing = np.isnan(values)
+    text = np.where(missing, np.broadcast_to(missing_text, values.shape),
+                    np.char.mod('%.1f%%', np.where(missing, 0.0, values))).astype(object)
+    dates = np.broadcast_to(date_range.strftime("%Y-%m-%d").to_numpy(dtype=object), values.shape)
+
+    z_matrix = pd.DataFrame(values, index=sorted_tickers, columns=days_range)
+    text_matrix = pd.DataFrame(text, index=sorted_tickers, columns=days_range)
+    date_matrix = pd.DataFrame(dates, index=sorted_tickers, columns=days_range)
+    return z_matrix, text_matrix, date_matrix
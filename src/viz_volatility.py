@@ -3,7 +3,11 @@ import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 
-def build_volatility_chart(df, events, selected_event, window_days=7, rolling_window=5, grouping="individual"): 
+from rolling_stats import rolling_std
+from data_processor import schema_of
+from render_mode import use_webgl
+
+def build_volatility_chart(df, events, selected_event, window_days=7, rolling_window=5, grouping="individual", cube=None, tensor=None, render_mode="auto"): 
     """ Construit un graphique de volatilité montrant l'évolution de l'écart-type des rendements autour d'un événement géopolitique.
     Parameters:
     -----------
@@ -13,6 +17,10 @@ def build_volatility_chart(df, events, selected_event, window_days=7, rolling_wi
     window_days : nombre de jours de chaque côté de l'événement
     rolling_window : fenêtre mobile pour calculer la volatilité
     grouping : "individual", "region", ou "type" (Actions vs Matières premières)
+    cube : VolatilityCube précalculé sur df (optionnel), utilisé s'il contient rolling_window
+    tensor : EventTensor en jours calendaires construit sur df (optionnel) ;
+    le calcul sur df reste la référence
+    render_mode : "auto" (WebGL au-delà de WEBGL_MIN_POINTS points), "svg" ou "webgl"
     """
 
     # Trouver l'événement sélectionné
@@ -27,44 +35,25 @@ def build_volatility_chart(df, events, selected_event, window_days=7, rolling_wi
 
     event_date = pd.to_datetime(event_info['date'])
 
-    # === FORCER LE CALCUL DE VOLATILITÉ POUR TOUS LES INDICES ===
-    # Au lieu d'utiliser les colonnes existantes, recalculer pour s'assurer d'avoir tout
-    df_calc = _calculate_volatility(df, rolling_window)
-    
-    # Convertir en format long pour le traitement
-    df_long = df_calc.reset_index().melt(
-        id_vars=['Date'], 
-        var_name='Column', 
-        value_name='Value'
-    ).dropna()
-
-    # Séparer les colonnes de volatilité
-    df_volatility = df_long[df_long['Column'].str.endswith('_volatility')].copy()
-    df_volatility['Ticker'] = df_volatility['Column'].str.replace('_volatility', '')
-    df_volatility = df_volatility.rename(columns={'Value': 'volatility'})
-
-    # DEBUG: Afficher les indices trouvés
-    unique_tickers = df_volatility['Ticker'].unique()
-    print(f"📊 Indices volatilité trouvés: {len(unique_tickers)}")
-    print(f"Liste: {list(unique_tickers)}")
-
-    if len(df_volatility) == 0:
-        return _create_empty_volatility("Aucune donnée de volatilité disponible")
-
-
-    # Filtrer autour de l'événement
-    mask = (
-        (df_volatility['Date'] >= event_date - pd.Timedelta(days=window_days)) &
-        (df_volatility['Date'] <= event_date + pd.Timedelta(days=window_days))
-    )
-    df_win = df_volatility.loc[mask].copy()
+    # Volatilités (indices x dates) de la fenêtre uniquement
+    metric = ('volatility', rolling_window)
+    base_columns = schema_of(df).tickers()
+    if tensor is not None and tensor.covers(df, selected_event, window_days, metric, base_columns):
+        # Tranche du tenseur des événements : volatilités déjà calculées pour cette fenêtre
+        values = tensor.slice(selected_event, metric, window_days)
+        dates = pd.DatetimeIndex(tensor.window_dates(selected_event, window_days))
+    else:
+        if not base_columns:
+            return _create_empty_volatility("Aucune donnée de volatilité disponible")
+        values, dates = _window_volatility(df, event_date, window_days, rolling_window, cube)
 
+    # Calculer les jours relatifs
+    day_rel = ((dates - event_date) // pd.Timedelta(days=1)).to_numpy()
+
+    df_win = _long_window(values, dates, base_columns, day_rel)
     if len(df_win) == 0:
         return _create_empty_volatility(f"Aucune donnée autour du {event_date.strftime('%Y-%m-%d')}")
 
-    # Calculer les jours relatifs
-    df_win['day_rel'] = (df_win['Date'] - event_date).dt.days
-
     # Appliquer le groupement
     df_grouped = _apply_grouping(df_win, grouping)
 
@@ -74,6 +63,7 @@ def build_volatility_chart(df, events, selected_event, window_days=7, rolling_wi
         x='day_rel',
         y='volatility',
         color='Group',
+        render_mode='webgl' if use_webgl(len(df_grouped), render_mode) else 'svg',
         labels={
             'day_rel': 'Jours relatifs à l\'événement',
             'volatility': f'Volatilité (σ {rolling_window} jours)',
@@ -138,34 +128,46 @@ def build_volatility_chart(df, events, selected_event, window_days=7, rolling_wi
 
     return fig
 
-def _calculate_volatility(df, rolling_window):
-    """Calcule la volatilité pour tous les indices disponibles."""
-    df_calc = df.copy()
-    
-    # Récupérer tous les indices (colonnes qui ne sont pas des calculs)
-    base_columns = [col for col in df.columns if not col.endswith(('_return', '_volatility'))]
-    
-    print(f"🔍 Calcul volatilité pour {len(base_columns)} indices")
-    
-    for col in base_columns:
-        try:
-            # Utiliser la colonne _return si elle existe, sinon calculer
-            return_col = f"{col}_return"
-            if return_col in df.columns:
-                returns = df[return_col]
-            else:
-                returns = df[col].pct_change()
-            
-            # Calculer la volatilité (écart-type mobile)
-            volatility = returns.rolling(window=rolling_window, min_periods=1).std()
-            df_calc[f"{col}_volatility"] = volatility
-            
-        except Exception as e:
-            print(f"⚠️ Erreur calcul volatilité pour {col}: {e}")
-            continue
-    
-    return df_calc
-
+def _window_volatility(df, event_date, window_days, rolling_window, cube=None):
+    """
+    Volatilités (indices x dates) des seules dates de [event_date ± window_days].
+    Les rendements sont lus à partir de rolling_window lignes avant la fenêtre,
+    pour que l'écart-type mobile soit identique à celui calculé sur tout l'historique.
+    """
+    schema = schema_of(df)
+    base_columns = schema.tickers()
+    lo = df.index.searchsorted(event_date - pd.Timedelta(days=window_days), side='left')
+    hi = df.index.searchsorted(event_date + pd.Timedelta(days=window_days), side='right')
+    dates = df.index[lo:hi]
+
+    if cube is not None and cube.covers(df, rolling_window, base_columns):
+        return np.asarray(cube.get(rolling_window)[lo:hi], dtype=np.float64).T, dates
+
+    # Fenêtre + marge : rolling_window - 1 lignes pour l'écart-type, une de plus pour la variation
+    start = max(lo - rolling_window, 0)
+    padded = df.iloc[start:hi]
+
+    # Utiliser la colonne _return si elle existe, sinon calculer
+    returns = np.column_stack([
+        padded.iloc[:, schema.position(col, 'return')].to_numpy(dtype=np.float64) if schema.has(col, 'return')
+        else padded.iloc[:, schema.position(col)].astype('float64').pct_change().to_numpy()
+        for col in base_columns
+    ])
+
+    # Calculer la volatilité (écart-type mobile) de tous les indices en une fois
+    volatility = rolling_std(returns, rolling_window)[lo - start:]
+    return volatility.T, dates
+
+def _long_window(values, dates, tickers, day_rel):
+    """Format long (Date, Ticker, volatility, day_rel) des valeurs non NaN (indices x dates)."""
+    valid = ~np.isnan(values)
+    shape = values.shape
+    return pd.DataFrame({
+        'Date': np.broadcast_to(dates.to_numpy(), shape)[valid],
+        'Ticker': np.broadcast_to(np.array(tickers, dtype=object)[:, None], shape)[valid],
+        'volatility': values[valid],
+        'day_rel': np.broadcast_to(day_rel, shape)[valid]
+    })
 
 def _apply_grouping(df_win, grouping): 
     """Applique le groupement spécifié."""
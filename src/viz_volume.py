@@ -1,16 +1,55 @@
 import pandas as pd
 import plotly.graph_objects as go
 import numpy as np
+import threading
+from collections import OrderedDict
 from datetime import datetime, timedelta
 
-def build_polar_volume_chart(df, events, ticker, rolling_window=7):
+from data_processor import schema_of
+from render_mode import use_webgl
+
+# Nombre minimal de points du graphique polaire (2 points par degré)
+POLAR_MIN_POINTS = 720
+
+# Diamètre du cercle polaire en pixels (750 px moins les marges, domaine 0.08-0.92)
+POLAR_DIAMETER_PX = 495
+# Nombre maximal de points tracés : un point par pixel de la circonférence
+POLAR_MAX_POINTS = int(np.pi * POLAR_DIAMETER_PX)
+
+# Profils lissés gardés en mémoire : les (données, ticker, lissage) les plus récents
+POLAR_CACHE_SIZE = 64
+
+RESOLUTION_LABELS = {1: "journalier", 7: "hebdomadaire", 30: "mensuel"}
+
+# Événements repérés sur la vue polaire
+POLAR_EVENTS = [
+    {"name": "Crise 2008", "date": "2008-09-15"},
+    {"name": "Printemps arabe", "date": "2011-01-25"},
+    {"name": "Fukushima", "date": "2011-03-11"},
+    {"name": "Brexit", "date": "2016-06-23"},
+    {"name": "Trump élu", "date": "2016-11-08"},
+    {"name": "Guerre Chine-USA", "date": "2018-07-06"},
+    {"name": "Soleimani", "date": "2020-01-03"},
+    {"name": "COVID-19", "date": "2020-03-11"},
+    {"name": "Capitole", "date": "2021-01-06"},
+    {"name": "Ukraine", "date": "2022-02-24"}
+]
+
+def build_polar_volume_chart(df, events, ticker, rolling_window=7, resolution_days=1, max_points=POLAR_MAX_POINTS, render_mode="auto", data_key=None):
     """
     Graphique polaire chronologique - données dans l'ordre temporel correct.
+    resolution_days : jours représentés par un point de df (niveau de la pyramide),
+    le lissage de rolling_window jours est converti en nombre de points.
+    max_points : au-delà, la courbe est réduite par min/max (forme préservée)
+    render_mode : "auto" (Scatterpolargl au-delà de WEBGL_MIN_POINTS points), "svg" ou "webgl"
+    data_key : identifiant des données de df (ex: version des CSV et niveau de la
+    pyramide) ; le profil lissé est alors gardé en cache pour les appels suivants
     """
+    resolution_label = RESOLUTION_LABELS.get(resolution_days, f"{resolution_days} jours")
     
     # Vérifier que le ticker existe
     if ticker not in df.columns:
-        available_tickers = [col for col in df.columns if not col.endswith(('_return', '_volatility'))]
+        available_tickers = schema_of(df).tickers()
         print(f"Ticker {ticker} non trouvé. Tickers disponibles: {available_tickers}")
         
         fig = go.Figure()
@@ -19,75 +58,37 @@ def build_polar_volume_chart(df, events, ticker, rolling_window=7):
             x=0.5, y=0.5, xref="paper", yref="paper",
             showarrow=False, font=dict(size=16, color="red")
         )
-        fig.update_layout(title=f"Volume journalier - {ticker}", showlegend=False)
+        fig.update_layout(title=f"Volume {resolution_label} - {ticker}", showlegend=False)
         return fig
     
-    # Extraire les données du ticker sélectionné
-    ticker_data = df[ticker].dropna().copy()
+    # Profil lissé et mis à l'échelle (calculé une fois par ticker et lissage)
+    smoothing_points = max(1, round(rolling_window / resolution_days))
+    profile = _polar_profile(df, ticker, smoothing_points, data_key)
     
-    if len(ticker_data) == 0:
+    if profile is None:
         fig = go.Figure()
         fig.add_annotation(
             text=f"Aucune donnée valide pour {ticker}",
             x=0.5, y=0.5, xref="paper", yref="paper", 
             showarrow=False, font=dict(size=16, color="red")
         )
-        fig.update_layout(title=f"Volume journalier - {ticker}")
+        fig.update_layout(title=f"Volume {resolution_label} - {ticker}")
         return fig
     
-    # === LOGIQUE TEMPORELLE CHRONOLOGIQUE  ===
-    data = pd.DataFrame({
-        'Date': ticker_data.index,
-        'Volume': ticker_data.values
-    })
-    
-    data = data.sort_values('Date').reset_index(drop=True)
-    
-    if rolling_window > 1:
-        data['Volume_smooth'] = data['Volume'].rolling(
-            window=rolling_window, center=True, min_periods=1
-        ).mean()
-    else:
-        data['Volume_smooth'] = data['Volume']
-    
-    # === CALCUL DES ANGLES CHRONOLOGIQUE  ===
-    date_min = data['Date'].min()
-    date_max = data['Date'].max()
-    total_days = (date_max - date_min).days
-
-    data['Days_from_start'] = (data['Date'] - date_min).dt.days
-    data['Theta'] = (data['Days_from_start'] / total_days) * 360
-
-    # Détecter et gérer les valeurs aberrantes
-    Q1 = data['Volume_smooth'].quantile(0.25)
-    Q3 = data['Volume_smooth'].quantile(0.75)
-    IQR = Q3 - Q1
-    upper_fence = Q3 + 2.5 * IQR  # Seuil des outliers
-
-    outliers_mask = data['Volume_smooth'] > upper_fence
-    outliers_count = outliers_mask.sum()
-
-    if outliers_count > 0:
-        # Utiliser une échelle logarithmique pour préserver les variations
-        data['Volume_log'] = np.log1p(data['Volume_smooth'])  # log(1+x) pour éviter log(0)
-        data['Radius'] = data['Volume_log'] / data['Volume_log'].max()  # Normaliser 0-1
-        scale_info = f"échelle log, {outliers_count} outliers détectés"
-    else:
-        # Échelle linéaire normale
-        data['Radius'] = data['Volume_smooth'] / data['Volume_smooth'].max()  # Normaliser 0-1
-        scale_info = "échelle linéaire"
-
-
+    # Réduction à la résolution du graphique
+    points = _downsample(profile, max_points)
+    theta, radius = profile['theta'][points], profile['radius'][points]
+    scatter_polar = go.Scatterpolargl if use_webgl(len(points), render_mode) else go.Scatterpolar
     
     # === CRÉATION DU GRAPHIQUE ===
     fig = go.Figure()
     
     # 1) TRACE DE REMPLISSAGE 
-    if len(data) > 2:
-        fill_angles = np.concatenate([[data['Theta'].iloc[0]], data['Theta'].values, [data['Theta'].iloc[-1]]])
-        fill_radius = np.concatenate([[0], data['Radius'].values, [0]])
+    if len(points) > 2:
+        fill_angles = np.concatenate([[theta[0]], theta, [theta[-1]]])
+        fill_radius = np.concatenate([[0], radius, [0]])
         
-        fig.add_trace(go.Scatterpolar(
+        fig.add_trace(scatter_polar(
             r=fill_radius,
             theta=fill_angles,
             mode='lines',
@@ -100,9 +101,9 @@ def build_polar_volume_chart(df, events, ticker, rolling_window=7):
         ))
 
     # 2) TRACE PRINCIPALE 
-    fig.add_trace(go.Scatterpolar(
-        r=data['Radius'],
-        theta=data['Theta'],
+    fig.add_trace(scatter_polar(
+        r=radius,
+        theta=theta,
         mode='lines+markers',
         name=f'Volume {ticker}',
         line=dict(color='teal', width=2),
@@ -113,24 +114,12 @@ def build_polar_volume_chart(df, events, ticker, rolling_window=7):
             "📊 Volume: %{r:.2f}Md<br>" +
             "<extra></extra>"
         ),
-        customdata=data['Date'].dt.strftime('%d/%m/%Y')
+        customdata=profile['labels'][points]
     ))
 
     # 3) REPÈRES ANNUELS 
     year_annotations = []
-    years_in_data = sorted(data['Date'].dt.year.unique())
-
-    for year in years_in_data:
-        year_start = pd.Timestamp(f"{year}-01-01")
-        if year_start < date_min:
-            year_start = date_min
-        elif year_start > date_max:
-            continue
-            
-        days_from_start = (year_start - date_min).days
-        angle_deg = (days_from_start / total_days) * 360
-        
-   
+    for year, angle_deg in profile['years']:
         adjusted_angle_rad = np.radians(90 - angle_deg)  
         
         year_annotations.append(
@@ -148,46 +137,34 @@ def build_polar_volume_chart(df, events, ticker, rolling_window=7):
             )
         )
 
-    # 4) ÉVÉNEMENTS GÉOPOLITIQUES 
-    events_data = [
-        {"name": "Crise 2008", "date": "2008-09-15"},
-        {"name": "Printemps arabe", "date": "2011-01-25"},
-        {"name": "Fukushima", "date": "2011-03-11"},
-        {"name": "Brexit", "date": "2016-06-23"},
-        {"name": "Trump élu", "date": "2016-11-08"},
-        {"name": "Guerre Chine-USA", "date": "2018-07-06"},
-        {"name": "Soleimani", "date": "2020-01-03"},
-        {"name": "COVID-19", "date": "2020-03-11"},
-        {"name": "Capitole", "date": "2021-01-06"},
-        {"name": "Ukraine", "date": "2022-02-24"}
-    ]
-
-    max_radius = data['Radius'].max() if len(data) > 0 else 5
-
-    for event in events_data:
-        event_date = pd.to_datetime(event['date'])
-        
-        if event_date < date_min or event_date > date_max:
-            continue
-        
-        days_from_start = (event_date - date_min).days
-        event_theta = (days_from_start / total_days) * 360
-        
+    # 4) ÉVÉNEMENTS GÉOPOLITIQUES (une seule trace, segments séparés par des trous)
+    date_min, date_max, total_days = profile['date_min'], profile['date_max'], profile['total_days']
+    shown = [event for event in POLAR_EVENTS if date_min <= pd.to_datetime(event['date']) <= date_max]
+
+    if shown:
         n_points = 20
-        r_line = np.linspace(0, max_radius * 1.15, n_points)
-        theta_line = np.full(n_points, event_theta)
-        
-        fig.add_trace(go.Scatterpolar(
-            r=r_line,
-            theta=theta_line,
+        event_days = np.array([(pd.to_datetime(event['date']) - date_min).days for event in shown])
+        event_theta = (event_days / total_days) * 360
+
+        # Chaque événement : n_points le long du rayon, puis un point vide (None) pour couper la ligne
+        r_line = np.append(np.linspace(0, profile['max_radius'] * 1.15, n_points), np.nan)
+        r_events = np.tile(r_line, len(shown))
+        theta_events = np.repeat(event_theta, n_points + 1).astype(float)
+        theta_events[n_points::n_points + 1] = np.nan
+        labels = np.repeat([[event['name'], event['date']] for event in shown], n_points + 1, axis=0)
+
+        fig.add_trace(scatter_polar(
+            r=r_events,
+            theta=theta_events,
             mode='lines+markers',
             line=dict(color='brown', width=1.5, dash='dash'),
             marker=dict(size=0.5, color='brown', opacity=0.3),
             showlegend=False,
-            name=event['name'],
+            name="Événements",
+            customdata=labels,
             hovertemplate=(
-                f"<b>{event['name']}</b><br>" +
-                f"Date: {event['date']}<br>" +
+                "<b>%{customdata[0]}</b><br>" +
+                "Date: %{customdata[1]}<br>" +
                 "Événement géopolitique<br>" +
                 "<extra></extra>"
             )
@@ -196,7 +173,7 @@ def build_polar_volume_chart(df, events, ticker, rolling_window=7):
     # 5) CONFIGURATION DU LAYOUT 
     fig.update_layout(
         title=dict(
-            text=f"Volume journalier - {ticker} (Lissage: {rolling_window} jours)",
+            text=f"Volume {resolution_label} - {ticker} (Lissage: {rolling_window} jours)",
             x=0.5,
             font=dict(size=16, color="#2c3e50")
         ),
@@ -238,3 +215,113 @@ def build_polar_volume_chart(df, events, ticker, rolling_window=7):
     )
 
     return fig
+
+
+_POLAR_PROFILES = OrderedDict()
+_POLAR_LOCK = threading.Lock()
+
+def _polar_profile(df, ticker, smoothing_points, data_key=None):
+    """
+    Profil de la vue polaire d'un ticker (angles, rayons mis à l'échelle,
+    libellés des dates, repères annuels), None si aucune donnée. Avec un
+    data_key, il est calculé une fois par (données, ticker, lissage) puis
+    gardé dans un cache LRU partagé par les threads du serveur : la clé ne
+    dépend pas de l'objet df, qui peut être un nouveau DataFrame à chaque
+    appel (history() des sources à la demande).
+    """
+    if data_key is None:
+        return _compute_polar_profile(df[ticker], smoothing_points)
+
+    key = (data_key, ticker, smoothing_points)
+    with _POLAR_LOCK:
+        if key in _POLAR_PROFILES:
+            _POLAR_PROFILES.move_to_end(key)
+            return _POLAR_PROFILES[key]
+
+    # Calcul hors du verrou : les autres vues restent servies pendant ce temps
+    profile = _compute_polar_profile(df[ticker], smoothing_points)
+    with _POLAR_LOCK:
+        _POLAR_PROFILES[key] = profile
+        _POLAR_PROFILES.move_to_end(key)
+        while len(_POLAR_PROFILES) > POLAR_CACHE_SIZE:
+            _POLAR_PROFILES.popitem(last=False)
+    return profile
+
+def _compute_polar_profile(series, smoothing_points):
+    ticker_data = series.dropna()
+    if len(ticker_data) == 0:
+        return None
+
+    # === LOGIQUE TEMPORELLE CHRONOLOGIQUE  ===
+    ticker_data = ticker_data.sort_index()
+    dates = pd.DatetimeIndex(ticker_data.index)
+    volume = pd.Series(ticker_data.to_numpy())
+
+    if smoothing_points > 1:
+        volume_smooth = volume.rolling(window=smoothing_points, center=True, min_periods=1).mean()
+    else:
+        volume_smooth = volume
+
+    # === CALCUL DES ANGLES CHRONOLOGIQUE  ===
+    date_min = dates.min()
+    date_max = dates.max()
+    total_days = (date_max - date_min).days
+
+    days_from_start = ((dates - date_min).days).to_numpy()
+    theta = (days_from_start / total_days) * 360
+
+    # Détecter et gérer les valeurs aberrantes
+    Q1 = volume_smooth.quantile(0.25)
+    Q3 = volume_smooth.quantile(0.75)
+    IQR = Q3 - Q1
+    upper_fence = Q3 + 2.5 * IQR  # Seuil des outliers
+
+    if (volume_smooth > upper_fence).sum() > 0:
+        # Utiliser une échelle logarithmique pour préserver les variations
+        volume_log = np.log1p(volume_smooth)  # log(1+x) pour éviter log(0)
+        radius = volume_log / volume_log.max()  # Normaliser 0-1
+    else:
+        # Échelle linéaire normale
+        radius = volume_smooth / volume_smooth.max()  # Normaliser 0-1
+    radius = radius.to_numpy()
+
+    # Repères annuels : angle du 1er janvier (ou du début des données)
+    years = []
+    for year in sorted(dates.year.unique()):
+        year_start = pd.Timestamp(f"{year}-01-01")
+        if year_start < date_min:
+            year_start = date_min
+        elif year_start > date_max:
+            continue
+        years.append((year, ((year_start - date_min).days / total_days) * 360))
+
+    return {
+        'theta': theta,
+        'radius': radius,
+        'labels': np.asarray(dates.strftime('%d/%m/%Y')),
+        'years': years,
+        'date_min': date_min,
+        'date_max': date_max,
+        'total_days': total_days,
+        'max_radius': radius.max(),
+    }
+
+def _downsample(profile, max_points):
+    """
+    Positions des points gardés : tous si la courbe tient dans max_points,
+    sinon le minimum et le maximum de chaque tranche d'angle (la forme de la
+    courbe est préservée, premier et dernier points inclus).
+    """
+    radius = profile['radius']
+    n = len(radius)
+    if n <= max_points:
+        return np.arange(n)
+
+    n_buckets = max(max_points // 2, 1)
+    buckets = np.minimum((profile['theta'] / 360 * n_buckets).astype(np.int64), n_buckets - 1)
+    # Tri par tranche puis par rayon : premier = minimum, dernier = maximum de chaque tranche
+    order = np.lexsort((radius, buckets))
+    sorted_buckets = buckets[order]
+    first = np.flatnonzero(np.r_[True, sorted_buckets[1:] != sorted_buckets[:-1]])
+    last = np.r_[first[1:] - 1, n - 1]
+    return np.unique(np.concatenate([order[first], order[last], [0, n - 1]]))